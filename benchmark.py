@@ -0,0 +1,159 @@
+"""リンクカード生成ツールのベンチマーク
+
+各エントリーポイントのコールドスタート時間（新しいPythonプロセスでの起動時間）を計測する。
+--fetch を指定すると、永続ブラウザプロファイルの有無でメタデータ取得時間を比較する
+（playwrightとChromiumが必要）。
+
+使用方法: python benchmark.py [--runs 回数] [--fetch URL [URL ...]]
+"""
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+
+SAMPLE_METADATA = {
+    'title': 'ベンチマーク用のリンクカード',
+    'description': 'コールドスタート計測用のサンプルメタデータ',
+    'image_url': None,
+    'url': 'https://example.com/benchmark'
+}
+
+
+def _time_command(args: list, runs: int) -> dict:
+    """コマンドを新しいプロセスで繰り返し実行し、所要時間を計測"""
+    timings = []
+    returncode = 0
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = subprocess.run(args, cwd=ROOT, capture_output=True)
+        timings.append(time.perf_counter() - started)
+        returncode = result.returncode
+    return {
+        'min_ms': min(timings) * 1000,
+        'median_ms': statistics.median(timings) * 1000,
+        'returncode': returncode
+    }
+
+
+def _loaded_heavy_modules(statement: str) -> list:
+    """指定の文を実行した直後に読み込まれている重いモジュールを調べる"""
+    code = (
+        f"{statement}\n"
+        "import sys, json\n"
+        "print(json.dumps([m for m in ('playwright', 'PIL', 'requests') if m in sys.modules]))"
+    )
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def benchmark_cold_start(runs: int) -> list:
+    """エントリーポイントごとのコールドスタート時間を計測"""
+    with tempfile.TemporaryDirectory() as tmp:
+        metadata_path = Path(tmp) / 'metadata.json'
+        metadata_path.write_text(json.dumps(SAMPLE_METADATA, ensure_ascii=False), encoding='utf-8')
+        output_path = Path(tmp) / 'card.png'
+
+        entries = [
+            ('python（基準）', [sys.executable, '-c', 'pass'], 'pass'),
+            ('import linkcard_generator', [sys.executable, '-c', 'import linkcard_generator'],
+             'import linkcard_generator'),
+            ('linkcard_generator.py（使用方法表示）', [sys.executable, 'linkcard_generator.py'],
+             'import linkcard_generator'),
+            ('linkcard_generator.py --from-metadata', [
+                sys.executable, 'linkcard_generator.py',
+                '--from-metadata', str(metadata_path), '-o', str(output_path)
+            ], None),
+            ('import linkcard_gui', [sys.executable, '-c', 'import linkcard_gui'], 'import linkcard_gui'),
+        ]
+
+        results = []
+        for name, args, statement in entries:
+            result = _time_command(args, runs)
+            result['name'] = name
+            result['heavy_modules'] = _loaded_heavy_modules(statement) if statement else None
+            results.append(result)
+        return results
+
+
+FETCH_SCRIPT = """
+import asyncio, json, sys
+from linkcard_generator import LinkCardGenerator
+
+async def run(profile_dir, urls):
+    generator = LinkCardGenerator(cache_dir=None, profile_dir=profile_dir or None)
+    await generator.fetcher.start()
+    try:
+        timings = []
+        for url in urls:
+            metadata = await generator.fetcher.fetch(url)
+            timings.append(metadata.navigation_ms)
+        return timings
+    finally:
+        await generator.fetcher.close()
+
+print(json.dumps(asyncio.run(run(sys.argv[1], sys.argv[2:]))))
+"""
+
+
+def benchmark_fetch(urls: list) -> list:
+    """永続プロファイルなし／あり（初回・2回目）で、新しいプロセスからの取得時間を比較"""
+    results = []
+    with tempfile.TemporaryDirectory() as profile_dir:
+        modes = [
+            ('プロファイルなし', ''),
+            ('永続プロファイル（初回）', profile_dir),
+            ('永続プロファイル（2回目）', profile_dir),
+        ]
+        for name, profile in modes:
+            result = subprocess.run(
+                [sys.executable, '-c', FETCH_SCRIPT, profile, *urls],
+                cwd=ROOT, capture_output=True, text=True
+            )
+            if result.returncode != 0:
+                lines = result.stderr.strip().splitlines() or ['']
+                errors = [line for line in lines if 'Error' in line]
+                results.append({'name': name, 'error': (errors or lines)[-1].strip()})
+                continue
+            timings = json.loads(result.stdout.strip().splitlines()[-1])
+            results.append({'name': name, 'timings': timings})
+    return results
+
+
+def main():
+    runs = 5
+    if '--runs' in sys.argv:
+        runs = int(sys.argv[sys.argv.index('--runs') + 1])
+    fetch_urls = []
+    if '--fetch' in sys.argv:
+        fetch_urls = [arg for arg in sys.argv[sys.argv.index('--fetch') + 1:] if not arg.startswith('--')]
+
+    print(f"## コールドスタート（{runs}回、新規プロセス）")
+    for result in benchmark_cold_start(runs):
+        status = "" if result['returncode'] in (0, 1) else f"  ※終了コード {result['returncode']}"
+        modules = result['heavy_modules']
+        loaded = f"  読み込み済み: {', '.join(modules) or 'なし'}" if modules is not None else ""
+        print(f"{result['name']:<40} 最小 {result['min_ms']:7.1f} ms  中央値 {result['median_ms']:7.1f} ms{loaded}{status}")
+
+
+    if fetch_urls:
+        print(f"\n## メタデータ取得（新規プロセス、{len(fetch_urls)} URL）")
+        for result in benchmark_fetch(fetch_urls):
+            if 'error' in result:
+                print(f"{result['name']:<30} 失敗: {result['error']}")
+                continue
+            timings = [t for t in result['timings'] if t is not None]
+            if not timings:
+                print(f"{result['name']:<30} 取得に失敗しました")
+                continue
+            print(f"{result['name']:<30} 初回リクエスト {timings[0]:7.1f} ms  合計 {sum(timings):8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""取得まわりのキャッシュ（ネガティブキャッシュ、永続ブラウザプロファイル）"""
+import json
+import os
+import time
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# 失敗の分類
+FAILURE_CATEGORIES = ('timeout', 'dns', 'http_status', 'navigation')
+
+
+class NegativeCache:
+    """取得に失敗したURLを記録し、指数バックオフで再試行を遅らせるキャッシュ
+
+    バックオフ中のURLは取得を試みずにフォールバックを返せるため、
+    応答しないURLのタイムアウトを毎回待たずに済む。
+    """
+
+    def __init__(self, path: str, base_delay: float = 60, max_delay: float = 24 * 60 * 60):
+        """初期化
+
+        Args:
+            path: 保存先のJSONファイル
+            base_delay: 1回目の失敗後に待つ秒数（失敗ごとに2倍）
+            max_delay: 待ち時間の上限（秒）
+        """
+        self.path = Path(path)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.entries = self._read()
+        # 未保存の変更（URL → エントリ。成功で削除したものはNone）
+        self._changes = {}
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def check(self, url: str) -> dict:
+        """バックオフ中ならそのエントリを返す（再試行してよければNone）"""
+        entry = self.entries.get(url)
+        if entry and time.time() < entry['retry_at']:
+            return entry
+        return None
+
+    def record_failure(self, url: str, category: str, error: str) -> dict:
+        """失敗を記録し、次に再試行できる時刻を決める"""
+        previous = self.entries.get(url)
+        failures = previous['failures'] + 1 if previous else 1
+        delay = min(self.base_delay * 2 ** (failures - 1), self.max_delay)
+        now = time.time()
+        entry = {
+            'category': category,
+            'error': error,
+            'failures': failures,
+            'last_failure': now,
+            'retry_at': now + delay
+        }
+        self.entries[url] = entry
+        self._changes[url] = entry
+        return entry
+
+    def record_success(self, url: str):
+        """成功したURLの記録を消す"""
+        if self.entries.pop(url, None) is not None:
+            self._changes[url] = None
+
+    def save(self):
+        """変更をファイルに保存
+
+        複数プロセスで同じファイルを共有できるよう、保存直前にファイルを読み直して
+        自分の変更だけを反映する。
+        """
+        if not self._changes:
+            return
+
+        entries = self._read()
+        for url, entry in self._changes.items():
+            if entry is None:
+                entries.pop(url, None)
+            else:
+                entries[url] = entry
+        # 期限切れから十分経ったエントリは捨てる
+        expire = time.time() - self.max_delay
+        entries = {url: entry for url, entry in entries.items() if entry['retry_at'] > expire}
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+        self.entries = entries
+        self._changes = {}
+
+
+def _try_lock(f) -> bool:
+    """ファイルの排他ロックを待たずに試みる（プロセス終了時にOSが自動で解放する）"""
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+class BrowserProfilePool:
+    """複数プロセスで共有できる永続ブラウザプロファイルの置き場
+
+    Chromiumのプロファイルは同時に1プロセスしか使えないため、profile_dirの下に
+    スロット（slot-0, slot-1, ...）を作り、ロックファイルで1プロセスずつ割り当てる。
+    スロットは実行をまたいで再利用されるので、HTTPディスクキャッシュや
+    Cookieが次回の実行に引き継がれる。
+    """
+
+    def __init__(self, profile_dir: str, max_slots: int = 64):
+        """初期化
+
+        Args:
+            profile_dir: プロファイルを置くディレクトリ
+            max_slots: 作成するスロットの上限（同時に使うブラウザの数）
+        """
+        self.profile_dir = Path(profile_dir)
+        self.max_slots = max_slots
+
+    def acquire(self) -> tuple:
+        """空いているスロットを確保する
+
+        Returns:
+            (スロットのディレクトリ, ロックファイル)。ロックファイルはreleaseに渡す
+        """
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        for index in range(self.max_slots):
+            lock_file = open(self.profile_dir / f"slot-{index}.lock", 'a+')
+            if _try_lock(lock_file):
+                slot_dir = self.profile_dir / f"slot-{index}"
+                slot_dir.mkdir(exist_ok=True)
+                return slot_dir, lock_file
+            lock_file.close()
+        raise RuntimeError(f"空いているブラウザプロファイルがありません: {self.profile_dir}")
+
+    def release(self, lock_file):
+        """スロットを解放"""
+        lock_file.close()
@@ -1,39 +1,308 @@
-Start-Process card_image_v3.pngStart-Process card_image_v3.pngimport asyncio
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import re
 import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from pathlib import Path
 from urllib.parse import urlparse, urljoin
-from playwright.async_api import async_playwright
-from PIL import Image, ImageDraw, ImageFont
 import io
-import requests
+import json
+from typing import TYPE_CHECKING
+
+from linkcard_cache import BrowserProfilePool, NegativeCache
+from linkcard_image import SOURCE_RANKS, ImageCandidate, choose_image
+from linkcard_journal import BatchJournal, hash_files
+from linkcard_sitemap import generate_from_sitemap
+from linkcard_url import URLCanonicalizer, normalize_url, pick_canonical
+
+# playwright / PIL / requests は起動を速くするため、使う段階で読み込む
+if TYPE_CHECKING:
+    from PIL import Image
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def _reset_peak_rss():
+    """ピークRSS（VmHWM）をリセット（Linuxのみ。バッチごとのピークを測るため）"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_mb() -> float:
+    """このPythonプロセスのピークRSS（MB）。取得できない環境ではNone"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOSはバイト、Linuxはキロバイト
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class LinkMetadata:
+    """パイプライン全体で受け渡すメタデータ（__slots__で1件あたりのメモリを抑える）
+    
+    ドメイン名は生成時に1回だけ求め、各段階で再パースしない。
+    """
+    
+    __slots__ = (
+        'title', 'description', 'image_url', 'url', 'canonical_url', 'domain',
+        'image_width', 'image_height', 'navigation_ms', 'extract_ms',
+        'error', 'error_category', 'skipped'
+    )
+    
+    def __init__(self, title: str, url: str, description: str = "", image_url: str = None,
+                 canonical_url: str = None, domain: str = None, image_width: int = None,
+                 image_height: int = None, navigation_ms: float = None, extract_ms: float = None,
+                 error: str = None, error_category: str = None, skipped: bool = False):
+        """初期化
+        
+        Args:
+            title: タイトル
+            url: 取得したURL
+            description: 説明文
+            image_url: サムネイル画像のURL
+            canonical_url: 正規URL（省略時はurl）
+            domain: 表示用のドメイン名（省略時はurlから求める）
+            image_width: 画像の幅（分かる場合）
+            image_height: 画像の高さ（分かる場合）
+            navigation_ms: ページ読み込みにかかった時間（ミリ秒）
+            extract_ms: メタデータ抽出にかかった時間（ミリ秒）
+            error: 取得に失敗した理由
+            error_category: 失敗の分類（timeout / dns / http_status / navigation）
+            skipped: バックオフ中で取得をスキップしたか
+        """
+        self.title = title
+        self.description = description or ""
+        self.image_url = image_url
+        self.url = url
+        self.canonical_url = canonical_url or url
+        self.domain = domain or urlparse(url).netloc
+        self.image_width = image_width
+        self.image_height = image_height
+        self.navigation_ms = navigation_ms
+        self.extract_ms = extract_ms
+        self.error = error
+        self.error_category = error_category
+        self.skipped = skipped
+    
+    def to_dict(self) -> dict:
+        """キャッシュ・ジャーナル保存用の辞書に変換"""
+        return {name: getattr(self, name) for name in self.__slots__}
+    
+    @classmethod
+    def from_dict(cls, data: dict) -> "LinkMetadata":
+        """辞書から復元（旧形式の 'image' キーにも対応）"""
+        fields = {name: data[name] for name in cls.__slots__ if name in data}
+        if 'image_url' not in fields and 'image' in data:
+            fields['image_url'] = data['image']
+        return cls(**fields)
+    
+    def __repr__(self) -> str:
+        return f"LinkMetadata(url={self.url!r}, title={self.title!r})"
+
+
+class FetchError(Exception):
+    """メタデータ取得の失敗（categoryは timeout / dns / http_status / navigation）"""
+    
+    def __init__(self, category: str, message: str):
+        super().__init__(message)
+        self.category = category
+
+
+def _classify_fetch_error(error: Exception) -> str:
+    """例外を失敗の分類に変換"""
+    if isinstance(error, FetchError):
+        return error.category
+    message = str(error)
+    if type(error).__name__ == 'TimeoutError' or 'ERR_TIMED_OUT' in message:
+        return 'timeout'
+    if 'ERR_NAME_NOT_RESOLVED' in message or 'ERR_NAME_RESOLUTION_FAILED' in message:
+        return 'dns'
+    return 'navigation'
+
 
 class MetadataFetcher:
     """URLからメタデータを取得するクラス（OGPフォールバック対応）"""
     
-    async def fetch(self, url: str) -> dict:
-        """メタデータを取得"""
+    def __init__(self, negative_cache: NegativeCache = None, profile_dir: str = None,
+                 disk_cache_mb: int = 256, canonicalizer: URLCanonicalizer = None,
+                 max_image_bytes: int = 10 * 1024 * 1024, max_image_pixels: int = 40_000_000):
+        """初期化
+        
+        Args:
+            negative_cache: 取得失敗を記録するキャッシュ。バッチ処理ではバックオフ中のURLを取得せずフォールバックを返す
+            profile_dir: 永続ブラウザプロファイルの置き場。指定すると実行をまたいで
+                HTTPディスクキャッシュを再利用する（複数プロセスで共有可）
+            disk_cache_mb: プロファイルごとのHTTPディスクキャッシュの上限（MB）
+            canonicalizer: 取得前にリダイレクトを解決するURLCanonicalizer（Noneなら正規化のみ）
+            max_image_bytes: 画像候補のバイト数の上限（CardGeneratorと同じ値にする）
+            max_image_pixels: 画像候補のピクセル数の上限（CardGeneratorと同じ値にする）
+        """
+        self.negative_cache = negative_cache
+        self.canonicalizer = canonicalizer
+        self.max_image_bytes = max_image_bytes
+        self.max_image_pixels = max_image_pixels
+        self.profile_pool = BrowserProfilePool(profile_dir) if profile_dir else None
+        self.disk_cache_mb = disk_cache_mb
+        self._playwright = None
+        self._browser = None
+        self._profile_lock = None
+    
+    async def start(self):
+        """共有ブラウザを起動（バッチ処理で1つのブラウザを使い回す）"""
+        if self._browser is None:
+            from playwright.async_api import async_playwright
+            self._playwright = await async_playwright().start()
+            self._browser, self._profile_lock = await self._launch(self._playwright)
+    
+    async def _launch(self, playwright) -> tuple:
+        """ブラウザを起動（profile_dirがあれば永続プロファイルで起動）
+        
+        Returns:
+            (Browser または BrowserContext, プロファイルのロック)
+        """
+        if self.profile_pool is None:
+            return await playwright.chromium.launch(headless=True), None
+        
+        slot_dir, lock = self.profile_pool.acquire()
+        try:
+            context = await playwright.chromium.launch_persistent_context(
+                str(slot_dir), headless=True,
+                args=[f"--disk-cache-size={self.disk_cache_mb * 1024 * 1024}"]
+            )
+        except BaseException:
+            self.profile_pool.release(lock)
+            raise
+        return context, lock
+    
+    async def _shutdown(self, browser, lock):
+        """ブラウザを終了し、プロファイルのロックを解放"""
+        try:
+            await browser.close()
+        finally:
+            if lock is not None:
+                self.profile_pool.release(lock)
+    
+    @property
+    def is_running(self) -> bool:
+        """共有ブラウザが起動中か"""
+        return self._browser is not None
+    
+    async def close(self):
+        """共有ブラウザを終了"""
+        if self._browser is not None:
+            await self._shutdown(self._browser, self._profile_lock)
+            self._browser = None
+            self._profile_lock = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+    
+    async def resolve(self, url: str, skip_backed_off: bool = False) -> tuple:
+        """取得するURLとキャッシュキー（正規化したURL）を求める
+        
+        canonicalizerがない場合と、skip_backed_offでバックオフ中のURLはリダイレクトを解決しない。
+        """
+        key = normalize_url(url)
+        if self.canonicalizer is None:
+            return url, key
+        if skip_backed_off and self.negative_cache is not None and self.negative_cache.check(key):
+            return url, key
+        return await asyncio.get_running_loop().run_in_executor(None, self.canonicalizer.resolve, url)
+    
+    async def fetch(self, url: str, resolved: tuple = None, skip_backed_off: bool = False) -> LinkMetadata:
+        """メタデータを取得
+        
+        取得の成否はnegative_cacheに記録するが、バックオフ中のURLを取得せずに
+        フォールバックで済ませるのはskip_backed_offを指定したとき（バッチ処理）だけ。
+        1件ずつの生成では、失敗したURLを手動で再試行できるよう常に取得する。
+        
+        Args:
+            resolved: resolve() の結果（求め済みなら渡す）
+            skip_backed_off: バックオフ中のURLは取得せずフォールバックを返す
+        """
+        url, key = resolved or await self.resolve(url, skip_backed_off)
+        if skip_backed_off and self.negative_cache is not None:
+            entry = self.negative_cache.check(key)
+            if entry:
+                retry_at = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry['retry_at']))
+                print(f"バックオフ中のためスキップ: {url}（{entry['category']}、{retry_at} 以降に再試行）")
+                metadata = self._get_fallback_metadata(url, entry['error'], entry['category'])
+                metadata.canonical_url = key
+                metadata.skipped = True
+                return metadata
+        
+        if self._browser is not None:
+            return await self._fetch_with_browser(self._browser, url, key)
+        
+        from playwright.async_api import async_playwright
         async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=True)
-            page = await browser.new_page()
-            
+            browser, lock = await self._launch(p)
             try:
-                await page.goto(url, wait_until='networkidle', timeout=30000)
-                await page.wait_for_timeout(500)
-                
-                metadata = {
-                    'title': await self._get_title(page, url),
-                    'description': await self._get_description(page),
-                    'image': await self._get_image(page, url),
-                    'url': url
-                }
-                
-                return metadata
-                
-            except Exception as e:
-                print(f"エラー: {e}")
-                return self._get_fallback_metadata(url)
+                return await self._fetch_with_browser(browser, url, key)
             finally:
-                await browser.close()
+                await self._shutdown(browser, lock)
+    
+    async def _fetch_with_browser(self, browser, url: str, key: str) -> LinkMetadata:
+        """指定のブラウザで新しいページを開いてメタデータを取得（keyは取得失敗の記録に使う）"""
+        page = await browser.new_page()
+        
+        try:
+            started = time.perf_counter()
+            response = await page.goto(url, wait_until='networkidle', timeout=30000)
+            if response is not None and response.status >= 400:
+                raise FetchError('http_status', f"HTTP {response.status}: {url}")
+            await page.wait_for_timeout(500)
+            navigated = time.perf_counter()
+            
+            image = await choose_image(
+                await self._get_image_candidates(page, url),
+                max_bytes=self.max_image_bytes, max_pixels=self.max_image_pixels
+            )
+            metadata = LinkMetadata(
+                title=await self._get_title(page, url),
+                description=await self._get_description(page),
+                image_url=image and image.url,
+                url=url,
+                canonical_url=await self._get_canonical(page) or key,
+                image_width=image and image.width,
+                image_height=image and image.height
+            )
+            metadata.navigation_ms = (navigated - started) * 1000
+            metadata.extract_ms = (time.perf_counter() - navigated) * 1000
+            
+            if self.negative_cache is not None:
+                self.negative_cache.record_success(key)
+            return metadata
+            
+        except Exception as e:
+            print(f"エラー: {e}")
+            category = _classify_fetch_error(e)
+            if self.negative_cache is not None:
+                self.negative_cache.record_failure(key, category, str(e))
+            metadata = self._get_fallback_metadata(url, str(e), category)
+            metadata.canonical_url = key
+            return metadata
+        finally:
+            await page.close()
     
     async def _get_title(self, page, url: str) -> str:
         """タイトルを優先順位付きで取得"""
@@ -93,147 +362,466 @@ class MetadataFetcher:
         
         return ""
     
-    async def _get_image(self, page, url: str) -> str:
-        """画像URLを優先順位付きで取得"""
-        selectors = [
-            'meta[property="og:image"]',
-            'meta[name="twitter:image"]',
-            'meta[itemprop="image"]',
-            'link[rel="image_src"]'
-        ]
+    async def _get_image_candidates(self, page, url: str) -> list:
+        """画像の候補をすべて取得（og:image → twitter:image → itemprop → image_src の順）
         
-        for selector in selectors:
-            try:
-                element = await page.query_selector(selector)
-                if element:
-                    if 'meta' in selector:
-                        image_url = await element.get_attribute('content')
-                    else:
-                        image_url = await element.get_attribute('href')
-                    
-                    if image_url:
-                        # 相対URLを絶対URLに変換
-                        return urljoin(url, image_url)
-            except:
+        og:image:width / og:image:height は直前のog:imageの寸法として扱う。
+        """
+        try:
+            tags = await page.eval_on_selector_all(
+                'meta[property^="og:image"], meta[name^="twitter:image"], '
+                'meta[itemprop="image"], link[rel="image_src"]',
+                """elements => elements.map(e => [
+                    e.getAttribute('property') || e.getAttribute('name') || e.getAttribute('itemprop')
+                        || 'image_src',
+                    e.getAttribute('content') || e.getAttribute('href')
+                ])"""
+            )
+        except:
+            return []
+        
+        candidates = {}
+        last_og = None
+        for name, value in tags:
+            name = (name or '').strip().lower()
+            value = (value or '').strip()
+            if not value:
                 continue
+            if name in ('og:image:width', 'og:image:height'):
+                if last_og is not None and value.isdigit():
+                    setattr(last_og, name.rsplit(':', 1)[1], int(value))
+                continue
+            if name in ('og:image', 'og:image:url', 'og:image:secure_url'):
+                source = 'og'
+            elif name in ('twitter:image', 'twitter:image:src'):
+                source = 'twitter'
+            elif name in ('image', 'image_src'):
+                source = 'itemprop' if name == 'image' else 'image_src'
+            else:
+                continue
+            
+            # 相対URLを絶対URLに変換（data: URIなどは使わない）
+            image_url = urljoin(url, value)
+            if not image_url.startswith(('http://', 'https://')):
+                continue
+            candidate = candidates.get(image_url)
+            if candidate is None:
+                candidate = candidates[image_url] = ImageCandidate(image_url, source)
+            if source == 'og':
+                last_og = candidate
         
+        return sorted(candidates.values(), key=lambda candidate: SOURCE_RANKS[candidate.source])
+    
+    async def _get_canonical(self, page) -> str:
+        """<link rel="canonical"> の正規化したURL（ないか信用できなければNone）"""
+        try:
+            element = await page.query_selector('link[rel="canonical"]')
+            if element:
+                return pick_canonical(page.url, await element.get_attribute('href'))
+        except:
+            pass
         return None
     
-    def _get_fallback_metadata(self, url: str) -> dict:
-        """フォールバックメタデータ"""
-        parsed = urlparse(url)
-        return {
-            'title': parsed.netloc,
-            'description': '',
-            'image': None,
-            'url': url
-        }
+    def _get_fallback_metadata(self, url: str, error: str = None,
+                               error_category: str = None) -> LinkMetadata:
+        """フォールバックメタデータ（取得に失敗した理由をerrorに入れる）"""
+        domain = urlparse(url).netloc
+        return LinkMetadata(
+            title=domain,
+            url=url,
+            domain=domain,
+            error=error,
+            error_category=error_category
+        )
+
+
+class CardVariant:
+    """出力バリアント（プラットフォームごとのカードサイズ）"""
+    
+    def __init__(self, name: str, width: int, height: int, suffix: str = ""):
+        """初期化
+        
+        Args:
+            name: バリアント名（例: large, small, square）
+            width: 出力幅
+            height: 出力高さ
+            suffix: 出力ファイル名に付ける接尾辞（空なら元のファイル名のまま）
+        """
+        self.name = name
+        self.width = width
+        self.height = height
+        self.suffix = suffix
+    
+    def output_path(self, base_path: str) -> str:
+        """このバリアントの出力パスを返す（例: card.png → card_small.png）"""
+        if not self.suffix:
+            return base_path
+        path = Path(base_path)
+        return str(path.with_name(f"{path.stem}_{self.suffix}{path.suffix}"))
+
+
+# 標準のバリアント（summary_large_image / summary / 正方形プレビュー）
+CARD_VARIANTS = {
+    'large': CardVariant('large', 1200, 630),
+    'small': CardVariant('small', 600, 315, 'small'),
+    'square': CardVariant('square', 600, 600, 'square'),
+}
 
 
 class CardGenerator:
     """リンクカード画像を生成するクラス（YouTubeサムネイル風）"""
     
-    def __init__(self):
+    def __init__(self, variants: list = None, max_image_bytes: int = 10 * 1024 * 1024,
+                 max_image_pixels: int = 40_000_000, background_cache_size: int = 32):
+        """初期化
+        
+        Args:
+            variants: 出力するCardVariantのリスト（先頭が基準の出力。省略時はlargeのみ）
+            max_image_bytes: ダウンロードする画像の最大バイト数
+            max_image_pixels: デコードする画像の最大ピクセル数（幅×高さ）
+            background_cache_size: 加工済み背景をキャッシュする画像の数
+        """
         self.width = 1200
         self.height = 630
         self.bg_color = (30, 30, 30)  # ダークグレー背景
+        self.variants = list(variants) if variants else [CARD_VARIANTS['large']]
+        self.max_image_bytes = max_image_bytes
+        self.max_image_pixels = max_image_pixels
+        self.background_cache_size = background_cache_size
+        self._fonts = {}
+        self._overlays = {}
+        
+        # 同じ画像（サイト共通のバナー等）の加工済み背景を使い回すためのキャッシュ
+        # 内容ハッシュ → {バリアント名: 加工済み背景}
+        self._backgrounds = OrderedDict()
+        self._blank_backgrounds = None
+        self._cache_lock = threading.Lock()
+        self.dedup_stats = {'hits': 0, 'misses': 0}
+        
+    def download(self, metadata: LinkMetadata) -> tuple:
+        """サムネイル画像をダウンロード（プレビューと本番の描画で共有するため）
         
-    def generate(self, metadata: dict, output_path: str):
-        """カード画像を生成（YouTubeサムネイル風）"""
-        # キャンバス作成
-        img = Image.new('RGB', (self.width, self.height), self.bg_color)
+        Returns:
+            (画像のバイト列, 内容のSHA-1)。画像がない・失敗した場合はNone
+        """
+        if not metadata.image_url:
+            return None
+        try:
+            return self._download_image(metadata.image_url)
+        except Exception as e:
+            print(f"画像の読み込みに失敗: {e}")
+            return None
+    
+    def generate(self, metadata: LinkMetadata, output_path: str, downloaded: tuple = None,
+                 dedup_stats: dict = None) -> list:
+        """カード画像を生成（YouTubeサムネイル風）
+        
+        元画像のダウンロードとデコードは1回だけ行い、全バリアントをそこから生成する。
+        既に加工した画像と同じ画像なら、キャッシュした背景にテキストだけを描画する。
+        
+        Args:
+            downloaded: download() の結果（省略時はここでダウンロードする）
+            dedup_stats: 指定すると背景キャッシュのヒット・ミスをこのdictにも数える（バッチごとの統計用）
+        
+        Returns:
+            (出力パス, 幅, 高さ) のリスト（self.variantsと同じ順序）
+        """
+        if downloaded is None:
+            downloaded = self.download(metadata)
         
-        # サムネイル画像を全面に配置
-        if metadata['image']:
+        backgrounds = None
+        if downloaded is not None:
             try:
-                thumb_img = self._download_image(metadata['image'])
-                if thumb_img:
-                    # 画像を1200x630にフィット（アスペクト比を保ちつつクロップ）
-                    thumb_img = self._resize_and_crop(thumb_img, self.width, self.height)
-                    img.paste(thumb_img, (0, 0))
+                backgrounds = self._get_backgrounds(downloaded, dedup_stats)
             except Exception as e:
                 print(f"画像の読み込みに失敗: {e}")
                 # 背景色のまま
+        if backgrounds is None:
+            backgrounds = self._get_blank_backgrounds()
         
-        # 半透明のグラデーションオーバーレイを作成（下部を暗く）
-        overlay = Image.new('RGBA', (self.width, self.height), (0, 0, 0, 0))
-        overlay_draw = ImageDraw.Draw(overlay)
-        
-        # グラデーション（下部200pxを徐々に暗く）
-        gradient_height = 300
-        for y in range(gradient_height):
-            alpha = int((y / gradient_height) * 180)  # 0→180の透明度
-            overlay_draw.rectangle(
-                [(0, self.height - gradient_height + y), (self.width, self.height - gradient_height + y + 1)],
-                fill=(0, 0, 0, alpha)
-            )
+        rendered = {}
+        for variant in self.variants:
+            img = backgrounds[variant.name].copy()
+            self._draw_text(img, metadata, variant)
+            path = variant.output_path(output_path)
+            img.save(path, 'PNG', quality=95)
+            rendered[variant.name] = (path, variant.width, variant.height)
+            print(f"リンクカードを生成しました: {path}")
+        
+        return [rendered[variant.name] for variant in self.variants]
+    
+    def render_preview(self, metadata: LinkMetadata, scale: float = 0.5,
+                       downloaded: tuple = None) -> Image.Image:
+        """プレビュー用に低解像度で直接描画（保存・エンコードはしない）
+        
+        レイアウトとフォントは同じ比率で縮小し、リサンプリングは高速なBILINEARを使う。
+        
+        Args:
+            scale: 1200x630に対する倍率（0.5なら600x315）
+            downloaded: download() の結果（省略時はここでダウンロードする）
+        
+        Returns:
+            PIL.Image（RGB）
+        """
+        from PIL import Image
+        
+        variant = CardVariant('preview', max(1, round(self.width * scale)), max(1, round(self.height * scale)))
+        if downloaded is None:
+            downloaded = self.download(metadata)
+        
+        background = None
+        if downloaded is not None:
+            try:
+                img = self._open_image(downloaded[0])
+                # JPEGはプレビューサイズ付近までデコード時に縮小
+                img.draft('RGB', (variant.width, variant.height))
+                background = self._resize_and_crop(
+                    img.convert('RGB'), variant.width, variant.height, Image.Resampling.BILINEAR
+                )
+            except Exception as e:
+                print(f"画像の読み込みに失敗: {e}")
+        if background is None:
+            background = Image.new('RGB', (variant.width, variant.height), self.bg_color)
+        
+        img = self._apply_overlay(background, variant)
+        self._draw_text(img, metadata, variant)
+        return img
+    
+    def _get_backgrounds(self, downloaded: tuple, dedup_stats: dict = None) -> dict:
+        """ダウンロードした画像から全バリアントの加工済み背景を取得（同じ画像ならキャッシュを使う）
+        
+        使い回すのは内容ハッシュ（SHA-1）が一致する画像だけ。見た目が似ていても
+        ラベルだけが違うテンプレート画像などがあるため、近い画像は別の画像として扱う。
+        """
+        data, content_hash = downloaded
+        
+        with self._cache_lock:
+            backgrounds = self._backgrounds.get(content_hash)
+            if backgrounds is not None:
+                self._backgrounds.move_to_end(content_hash)
+                self._count_dedup('hits', dedup_stats)
+                return backgrounds
+        
+        source = self._decode_source(self._open_image(data))
+        
+        # 大きいバリアントから順に、共通の中間画像を縮小して生成
+        backgrounds = {}
+        for variant in sorted(self.variants, key=lambda v: v.width * v.height, reverse=True):
+            background = self._resize_and_crop(source, variant.width, variant.height)
+            backgrounds[variant.name] = self._apply_overlay(background, variant)
+        
+        with self._cache_lock:
+            self._count_dedup('misses', dedup_stats)
+            self._backgrounds[content_hash] = backgrounds
+            self._backgrounds.move_to_end(content_hash)
+            while len(self._backgrounds) > self.background_cache_size:
+                self._backgrounds.popitem(last=False)
+        return backgrounds
+    
+    def _count_dedup(self, result: str, dedup_stats: dict = None):
+        """背景キャッシュのヒット・ミスを数える（_cache_lockを取得して呼ぶ）"""
+        self.dedup_stats[result] += 1
+        if dedup_stats is not None:
+            dedup_stats[result] += 1
+    
+    def _get_blank_backgrounds(self) -> dict:
+        """画像がない場合の背景（背景色＋グラデーション）"""
+        from PIL import Image
+        
+        with self._cache_lock:
+            backgrounds = self._blank_backgrounds
+        if backgrounds is None:
+            backgrounds = {
+                variant.name: self._apply_overlay(
+                    Image.new('RGB', (variant.width, variant.height), self.bg_color), variant
+                )
+                for variant in self.variants
+            }
+            with self._cache_lock:
+                self._blank_backgrounds = backgrounds
+        return backgrounds
+    
+    def _decode_source(self, img: Image.Image) -> Image.Image:
+        """元画像を1回だけデコードし、全バリアントを覆える最小の中間画像にする"""
+        from PIL import Image
+        
+        # 全バリアントを覆うのに必要な倍率（最大のもの）
+        scale = max(
+            max(v.width / img.width, v.height / img.height) for v in self.variants
+        )
+        target = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+        
+        # JPEGはデコード時に縮小（DCTスケーリング）しておく
+        img.draft('RGB', target)
+        img = img.convert('RGB')
+        
+        if scale < 1:
+            img = img.resize(target, Image.Resampling.LANCZOS)
+        return img
+    
+    def _apply_overlay(self, img: Image.Image, variant: CardVariant) -> Image.Image:
+        """下部を暗くするグラデーションを合成"""
+        from PIL import Image, ImageDraw
+        
+        width, height = variant.width, variant.height
+        overlay = self._overlays.get((width, height))
+        if overlay is None:
+            # レイアウトは1200x630を基準に拡大縮小
+            scale = min(width / self.width, height / self.height)
+            
+            # 半透明のグラデーションオーバーレイを作成（下部を暗く）
+            overlay = Image.new('RGBA', (width, height), (0, 0, 0, 0))
+            overlay_draw = ImageDraw.Draw(overlay)
+            
+            # グラデーション（下部300pxを徐々に暗く）
+            gradient_height = int(300 * scale)
+            for y in range(gradient_height):
+                alpha = int((y / gradient_height) * 180)  # 0→180の透明度
+                overlay_draw.rectangle(
+                    [(0, height - gradient_height + y), (width, height - gradient_height + y + 1)],
+                    fill=(0, 0, 0, alpha)
+                )
+            # サイズごとに使い回す
+            self._overlays[(width, height)] = overlay
         
         # オーバーレイを合成
         img = img.convert('RGBA')
         img = Image.alpha_composite(img, overlay)
-        img = img.convert('RGB')
+        return img.convert('RGB')
+    
+    def _draw_text(self, img: Image.Image, metadata: LinkMetadata, variant: CardVariant):
+        """加工済み背景にテキストを描画"""
+        from PIL import ImageDraw
+        
+        width, height = variant.width, variant.height
+        scale = min(width / self.width, height / self.height)
         
         # テキストを描画
         draw = ImageDraw.Draw(img)
-        
-        # フォント設定
-        try:
-            title_font = ImageFont.truetype("msgothic.ttc", 56)
-            desc_font = ImageFont.truetype("msgothic.ttc", 32)
-            url_font = ImageFont.truetype("msgothic.ttc", 24)
-        except:
-            title_font = ImageFont.load_default()
-            desc_font = ImageFont.load_default()
-            url_font = ImageFont.load_default()
+        title_font, desc_font, url_font = self._get_fonts(scale)
         
         # テキストのパディング
-        padding_x = 40
-        text_width = self.width - (padding_x * 2)
+        padding_x = int(40 * scale)
+        text_width = width - (padding_x * 2)
         
         # タイトル（下部に配置）
-        title = metadata['title']
-        title_y = self.height - 220
+        title = metadata.title
+        title_y = height - int(220 * scale)
         self._draw_wrapped_text(
             draw, title, (padding_x, title_y), text_width,
-            title_font, (255, 255, 255), max_lines=2
+            title_font, (255, 255, 255), max_lines=2, line_spacing=int(10 * scale)
         )
         
         # 説明文（タイトルの下）
-        if metadata['description']:
-            desc_y = self.height - 120
+        if metadata.description:
+            desc_y = height - int(120 * scale)
             self._draw_wrapped_text(
-                draw, metadata['description'], (padding_x, desc_y), text_width,
-                desc_font, (230, 230, 230), max_lines=2
+                draw, metadata.description, (padding_x, desc_y), text_width,
+                desc_font, (230, 230, 230), max_lines=2, line_spacing=int(10 * scale)
             )
         
         # ドメイン名（右下）
-        domain = urlparse(metadata['url']).netloc
-        url_y = self.height - 40
-        url_x = self.width - padding_x
+        domain = metadata.domain
+        url_y = height - int(40 * scale)
+        url_x = width - padding_x
         
         # テキストの幅を計算して右寄せ
         bbox = draw.textbbox((0, 0), domain, font=url_font)
         text_width = bbox[2] - bbox[0]
         draw.text((url_x - text_width, url_y), domain, font=url_font, fill=(200, 200, 200))
+    
+    def _get_fonts(self, scale: float) -> tuple:
+        """フォントを取得（倍率ごとにキャッシュ）"""
+        from PIL import ImageFont
         
-        # 保存
-        img.save(output_path, 'PNG', quality=95)
-        print(f"リンクカードを生成しました: {output_path}")
+        sizes = (max(8, int(56 * scale)), max(8, int(32 * scale)), max(8, int(24 * scale)))
+        if sizes not in self._fonts:
+            try:
+                self._fonts[sizes] = tuple(ImageFont.truetype("msgothic.ttc", size) for size in sizes)
+            except:
+                default = ImageFont.load_default()
+                self._fonts[sizes] = (default, default, default)
+        return self._fonts[sizes]
     
-    def _download_image(self, url: str) -> Image.Image:
-        """画像をダウンロード"""
+    def _download_image(self, url: str) -> tuple:
+        """画像をストリーミングでダウンロード（バイト数・ピクセル数の上限付き）
+        
+        Content-Lengthと画像ヘッダーの寸法を見て、上限を超える画像は
+        全体を読み込む前に打ち切る。
+        
+        Returns:
+            (画像のバイト列, 内容のSHA-1)。失敗時はNone
+        """
+        import requests
+        from PIL import Image
+        
         try:
-            response = requests.get(url, timeout=10, headers={
+            with requests.get(url, timeout=10, stream=True, headers={
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            })
-            if response.status_code == 200:
-                return Image.open(io.BytesIO(response.content))
-        except:
+            }) as response:
+                if response.status_code != 200:
+                    return None
+                
+                length = response.headers.get('Content-Length', '')
+                if length.isdigit() and int(length) > self.max_image_bytes:
+                    print(f"画像が大きすぎるためスキップ: {length} bytes > {self.max_image_bytes} bytes")
+                    return None
+                
+                data = io.BytesIO()
+                digest = hashlib.sha1()
+                size = None
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    data.write(chunk)
+                    digest.update(chunk)
+                    if data.tell() > self.max_image_bytes:
+                        print(f"画像が大きすぎるためスキップ: {self.max_image_bytes} bytes を超えました")
+                        return None
+                    # ヘッダーが読めた時点で寸法を確認（先頭256KBまで）
+                    if size is None and data.tell() <= 256 * 1024:
+                        size = self._peek_image_size(data.getvalue())
+                        if size and not self._check_pixels(size):
+                            return None
+                
+                data = data.getvalue()
+                if size is None and not self._check_pixels(self._open_image(data).size):
+                    return None
+                return data, digest.hexdigest()
+        except Exception:
             pass
         return None
     
-    def _resize_and_crop(self, img: Image.Image, target_width: int, target_height: int) -> Image.Image:
+    def _open_image(self, data: bytes) -> Image.Image:
+        """バイト列から画像を開く（デコードは実際に使うまで遅延される）"""
+        from PIL import Image
+        
+        return Image.open(io.BytesIO(data))
+    
+    def _peek_image_size(self, header: bytes) -> tuple:
+        """読み込み途中のデータから画像の寸法を取得（ヘッダーが未到着ならNone）"""
+        from PIL import Image
+        
+        try:
+            with Image.open(io.BytesIO(header)) as img:
+                return img.size
+        except Exception:
+            return None
+    
+    def _check_pixels(self, size: tuple) -> bool:
+        """ピクセル数が上限以内か確認"""
+        width, height = size
+        if width * height > self.max_image_pixels:
+            print(f"画像の解像度が大きすぎるためスキップ: {width}x{height}")
+            return False
+        return True
+    
+    def _resize_and_crop(self, img: Image.Image, target_width: int, target_height: int,
+                         resample: int = None) -> Image.Image:
         """画像をリサイズ＆クロップ（アスペクト比を保ちつつ全面に配置）"""
+        from PIL import Image
+        
+        if resample is None:
+            resample = Image.Resampling.LANCZOS
+        
         # 元の画像のアスペクト比
         img_ratio = img.width / img.height
         target_ratio = target_width / target_height
@@ -248,7 +836,7 @@ class CardGenerator:
             new_height = int(img.height * (target_width / img.width))
         
         # リサイズ
-        img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+        img = img.resize((new_width, new_height), resample)
         
         # 中央でクロップ
         left = (new_width - target_width) // 2
@@ -259,7 +847,7 @@ class CardGenerator:
         return img.crop((left, top, right, bottom))
     
     def _draw_wrapped_text(self, draw, text: str, position: tuple, max_width: int, 
-                           font, color: tuple, max_lines: int = 3):
+                           font, color: tuple, max_lines: int = 3, line_spacing: int = 10):
         """折り返しテキストを描画"""
         words = text.split()
         lines = []
@@ -288,7 +876,7 @@ class CardGenerator:
         for line in lines:
             draw.text((position[0], y), line, font=font, fill=color)
             bbox = draw.textbbox((0, 0), line, font=font)
-            y += bbox[3] - bbox[1] + 10
+            y += bbox[3] - bbox[1] + line_spacing
 
 
 class HTMLGenerator:
@@ -302,13 +890,31 @@ class HTMLGenerator:
         """
         self.base_url = base_url.rstrip('/')
     
-    def generate(self, metadata: dict, image_filename: str, output_path: str = "linkcard.html"):
-        """OGPタグ付きHTMLファイルを生成"""
+    def generate(self, metadata: LinkMetadata, image_filename: str, output_path: str = "linkcard.html",
+                 image_variants: list = None, large_image: bool = True):
+        """OGPタグ付きHTMLファイルを生成
+        
+        Args:
+            metadata: メタデータ
+            image_filename: 基準となる画像ファイル名（twitter:imageに使う）
+            output_path: 出力HTMLファイル名
+            image_variants: (画像ファイル名, 幅, 高さ) のリスト。指定時はバリアントごとに
+                og:image と og:image:width/height を出力する
+            large_image: 大きい画像のカード（summary_large_image）にするか。Falseならsummary
+        """
         # 画像URLを絶対URLに変換
-        if self.base_url:
-            image_url = f"{self.base_url}/{image_filename}"
+        image_url = self._image_url(image_filename)
+        
+        if image_variants:
+            og_image_tags = "\n".join(
+                f'    <meta property="og:image" content="{self._image_url(filename)}">\n'
+                f'    <meta property="og:image:width" content="{width}">\n'
+                f'    <meta property="og:image:height" content="{height}">'
+                for filename, width, height in image_variants
+            )
         else:
-            image_url = image_filename
+            og_image_tags = f'    <meta property="og:image" content="{image_url}">'
+        twitter_card = "summary_large_image" if large_image else "summary"
         
         html_content = f"""<!DOCTYPE html>
 <html lang="ja">
@@ -318,22 +924,22 @@ class HTMLGenerator:
     
     <!-- Open Graph / Facebook -->
     <meta property="og:type" content="website">
-    <meta property="og:url" content="{metadata['url']}">
-    <meta property="og:title" content="{self._escape_html(metadata['title'])}">
-    <meta property="og:description" content="{self._escape_html(metadata['description'])}">
-    <meta property="og:image" content="{image_url}">
+    <meta property="og:url" content="{metadata.url}">
+    <meta property="og:title" content="{self._escape_html(metadata.title)}">
+    <meta property="og:description" content="{self._escape_html(metadata.description)}">
+{og_image_tags}
     
     <!-- Twitter -->
-    <meta name="twitter:card" content="summary_large_image">
-    <meta name="twitter:url" content="{metadata['url']}">
-    <meta name="twitter:title" content="{self._escape_html(metadata['title'])}">
-    <meta name="twitter:description" content="{self._escape_html(metadata['description'])}">
+    <meta name="twitter:card" content="{twitter_card}">
+    <meta name="twitter:url" content="{metadata.url}">
+    <meta name="twitter:title" content="{self._escape_html(metadata.title)}">
+    <meta name="twitter:description" content="{self._escape_html(metadata.description)}">
     <meta name="twitter:image" content="{image_url}">
     
-    <title>{self._escape_html(metadata['title'])}</title>
+    <title>{self._escape_html(metadata.title)}</title>
     
     <!-- 自動リダイレクト（3秒後） -->
-    <meta http-equiv="refresh" content="3;url={metadata['url']}">
+    <meta http-equiv="refresh" content="3;url={metadata.url}">
     
     <style>
         body {{
@@ -375,7 +981,7 @@ class HTMLGenerator:
     <div class="container">
         <h1>リダイレクト中...</h1>
         <p class="redirect-message">3秒後に元のページに移動します。</p>
-        <p>自動で移動しない場合は、<a href="{metadata['url']}">こちらをクリック</a>してください。</p>
+        <p>自動で移動しない場合は、<a href="{metadata.url}">こちらをクリック</a>してください。</p>
     </div>
 </body>
 </html>"""
@@ -385,6 +991,12 @@ class HTMLGenerator:
         
         print(f"HTMLファイルを生成しました: {output_path}")
     
+    def _image_url(self, image_filename: str) -> str:
+        """画像ファイル名を（ベースURLがあれば）絶対URLに変換"""
+        if self.base_url:
+            return f"{self.base_url}/{image_filename}"
+        return image_filename
+    
     def _escape_html(self, text: str) -> str:
         """HTMLエスケープ処理"""
         if not text:
@@ -399,57 +1011,336 @@ class HTMLGenerator:
 class LinkCardGenerator:
     """リンクカード生成のメインクラス"""
     
-    def __init__(self, base_url: str = ""):
+    def __init__(self, base_url: str = "", variants: list = None, cache_dir: str = ".linkcard_cache",
+                 profile_dir: str = None, resolve_redirects: bool = True):
         """初期化
         
         Args:
             base_url: GitHub PagesのベースURL（例: https://username.github.io/linkcard）
+            variants: 出力するCardVariantのリスト（省略時はlargeのみ）
+            cache_dir: 取得失敗の記録などを保存するディレクトリ（Noneで無効）
+            profile_dir: 永続ブラウザプロファイルの置き場（Noneなら毎回空のプロファイル）
+            resolve_redirects: 取得前にHEADリクエストでリダイレクト（短縮URLなど）を解決するか
         """
-        self.fetcher = MetadataFetcher()
-        self.generator = CardGenerator()
+        self.negative_cache = NegativeCache(Path(cache_dir) / 'negative.json') if cache_dir else None
+        self.generator = CardGenerator(variants)
+        # 画像候補はダウンロードと同じ上限で選ぶ
+        self.fetcher = MetadataFetcher(
+            self.negative_cache, profile_dir,
+            canonicalizer=URLCanonicalizer() if resolve_redirects else None,
+            max_image_bytes=self.generator.max_image_bytes,
+            max_image_pixels=self.generator.max_image_pixels
+        )
         self.html_generator = HTMLGenerator(base_url)
     
-    async def generate(self, url: str, output_path: str = "linkcard.png", generate_html: bool = False):
-        """リンクカードを生成"""
+    async def generate(self, url: str, output_path: str = "linkcard.png", generate_html: bool = False,
+                       metadata_path: str = None, on_preview=None, preview_scale: float = 0.5):
+        """リンクカードを生成
+        
+        Args:
+            metadata_path: 指定すると取得したメタデータをJSONで保存する（--from-metadataで再描画可能）
+            on_preview: 指定するとメタデータ取得直後に低解像度のプレビュー（PIL.Image）を渡して呼ぶ。
+                その後、同じダウンロード済み画像から本番サイズを描画する
+            preview_scale: プレビューの倍率
+        
+        Returns:
+            出力ファイルのパスのリスト（先頭は基準の画像）
+        """
         print(f"メタデータを取得中: {url}")
         metadata = await self.fetcher.fetch(url)
+        if self.negative_cache is not None:
+            self.negative_cache.save()
+        if metadata_path:
+            _save_metadata(metadata, metadata_path)
         
-        print(f"タイトル: {metadata['title']}")
-        print(f"説明: {metadata['description'][:50]}..." if metadata['description'] else "説明: なし")
-        print(f"画像: {metadata['image']}" if metadata['image'] else "画像: なし")
+        print(f"タイトル: {metadata.title}")
+        print(f"説明: {metadata.description[:50]}..." if metadata.description else "説明: なし")
+        print(f"画像: {metadata.image_url}" if metadata.image_url else "画像: なし")
         
-        print("カード画像を生成中...")
-        self.generator.generate(metadata, output_path)
+        downloaded = None
+        if on_preview is not None:
+            downloaded = self.generator.download(metadata)
+            on_preview(self.generator.render_preview(metadata, preview_scale, downloaded))
         
+        print("カード画像を生成中...")
         if generate_html:
             print("HTMLファイルを生成中...")
-            # 画像ファイル名を取得（絶対URLに変換する必要がある場合は後で調整）
-            image_filename = Path(output_path).name
-            html_path = output_path.replace('.png', '.html')
-            self.html_generator.generate(metadata, image_filename, html_path)
+        paths = self.render(metadata, output_path, generate_html, downloaded)
+        
+        if generate_html:
             print("\n📝 次のステップ:")
-            print(f"1. {output_path} と {html_path} をWebサーバー（GitHub Pages等）にアップロード")
+            print(f"1. {' と '.join(paths)} をWebサーバー（GitHub Pages等）にアップロード")
             print("2. アップロード先のHTMLファイルのURLをXに投稿")
             print("3. Xで自動的にリンクカードが表示されます")
             print(f"4. カードをクリックすると {url} に遷移します")
+        
+        return paths
+    
+    async def generate_batch(self, urls, output_dir: str = "cards", generate_html: bool = False,
+                             concurrency: int = 4, job_id: str = None,
+                             journal_dir: str = ".linkcard_jobs", on_complete=None,
+                             retry_failed: bool = False, slots=None, measure_peak_rss: bool = True) -> dict:
+        """複数URLのリンクカードをまとめて生成
+        
+        URLは1件ずつ取り出して処理するため、大きなリストやジェネレーターでも
+        メモリ使用量は同時実行数ぶんに抑えられる。
+        ジャーナルと出力ファイル名は正規化したURLをキーにし、リダイレクト先や
+        rel="canonical" が同じページはバッチ内で1回だけ生成する。
+        
+        Args:
+            urls: URLのイテラブル
+            output_dir: 出力ディレクトリ
+            generate_html: HTMLファイルも生成するか
+            concurrency: 同時に処理するURL数
+            job_id: 指定するとジャーナルに結果を記録し、同じIDでの再実行時は完了済みを読み飛ばす
+            journal_dir: ジャーナルの保存先
+            on_complete: URLごとの処理後に on_complete(url, 成功したか) で呼ばれる
+            retry_failed: 取得失敗のバックオフ中のURLも取得し直す
+            slots: 指定すると、メタデータ取得を slots('page')、画像生成を slots('render') が返す
+                async withの中で行う（JobSchedulerが優先度順に枠を割り当てるため）
+            measure_peak_rss: ピークRSSをリセットしてこのバッチの値を測る。同じプロセスで
+                複数のバッチを同時に動かす場合は測れないのでFalseにする（peak_rss_mbはNone）
+        
+        Returns:
+            統計情報（total, succeeded, failed, skipped, duplicates, backoff_skipped, dedup_hits,
+            dedup_misses, elapsed, peak_rss_mb）。duplicatesは正規化したURLが既出でスキップした件数、
+            backoff_skippedは取得失敗のバックオフ中でスキップしたURLのリスト
+        """
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+        stats = {'total': 0, 'succeeded': 0, 'failed': 0, 'skipped': 0, 'duplicates': 0,
+                 'backoff_skipped': [], 'dedup_hits': 0, 'dedup_misses': 0, 'elapsed': 0.0,
+                 'peak_rss_mb': None}
+        # 背景の重複排除はこのバッチの描画だけを数える（同時に動く他のバッチの分を含めない）
+        dedup_stats = {'hits': 0, 'misses': 0}
+        journal = BatchJournal.for_job(job_id, journal_dir) if job_id else None
+        url_iter = iter(urls)
+        # このバッチで処理した（処理中の）正規化済みURL
+        seen = set()
+        slots = slots or _no_slot
+        loop = asyncio.get_running_loop()
+        
+        def render_and_hash(metadata, output_path):
+            paths = self.render(metadata, output_path, generate_html, dedup_stats=dedup_stats)
+            return hash_files(paths) if journal else {}
+        
+        def skip_reason(key: str) -> str:
+            """処理せずに済む理由（バッチ内で既出ならduplicates、完了済みならskipped）"""
+            if key in seen:
+                return 'duplicates'
+            if journal and journal.is_done(key):
+                seen.add(key)
+                return 'skipped'
+            return None
+        
+        async def worker():
+            # 共有イテレーターから1件ずつ取り出す
+            for url in url_iter:
+                stats['total'] += 1
+                # 再開時に完了済みのURLをネットワークにアクセスせず読み飛ばせるよう、
+                # リダイレクトを解決する前の正規化URLで先に確認する
+                pre_key = key = normalize_url(url)
+                reason = skip_reason(pre_key)
+                if reason is None:
+                    # 解決を待つ間に同じURLを別のワーカーが処理しないよう、先に既出にしておく
+                    seen.add(pre_key)
+                    resolved = await self.fetcher.resolve(url, not retry_failed)
+                    key = resolved[1]
+                    if key != pre_key:
+                        reason = skip_reason(key)
+                if reason:
+                    stats[reason] += 1
+                    if on_complete:
+                        on_complete(url, True)
+                    continue
+                seen.add(key)
+                aliases = [pre_key] if pre_key != key else None
+                
+                metadata = None
+                try:
+                    async with slots('page'):
+                        metadata = await self.fetcher.fetch(url, resolved, not retry_failed)
+                    canonical = metadata.canonical_url
+                    if canonical != key:
+                        # rel="canonical" で別のURLと同じページだと分かった場合
+                        if canonical in seen:
+                            stats['duplicates'] += 1
+                            if journal:
+                                journal.record(key, 'done', metadata.to_dict(), aliases=aliases)
+                            if on_complete:
+                                on_complete(url, True)
+                            continue
+                        seen.add(canonical)
+                    output_path = self._batch_output_path(canonical, output_dir)
+                    # 画像処理はイベントループを止めないよう別スレッドで実行
+                    async with slots('render'):
+                        outputs = await loop.run_in_executor(None, render_and_hash, metadata, output_path)
+                except Exception as e:
+                    print(f"生成に失敗: {url}: {e}")
+                    stats['failed'] += 1
+                    if journal:
+                        journal.record(key, 'failed', metadata and metadata.to_dict(), error=str(e),
+                                       aliases=aliases)
+                    if on_complete:
+                        on_complete(url, False)
+                    continue
+                
+                # 取得に失敗してフォールバックで描画したものは、再実行時に再試行する
+                error = metadata.error
+                if metadata.skipped:
+                    stats['backoff_skipped'].append(url)
+                stats['failed' if error else 'succeeded'] += 1
+                if journal:
+                    journal.record(key, 'failed' if error else 'done', metadata.to_dict(), outputs, error,
+                                   aliases)
+                if on_complete:
+                    on_complete(url, not error)
+        
+        if measure_peak_rss:
+            _reset_peak_rss()
+        started = time.perf_counter()
+        # 呼び出し側がブラウザを起動済みなら、複数バッチで使い回せるよう閉じない
+        owns_browser = not self.fetcher.is_running
+        await self.fetcher.start()
+        try:
+            await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+        finally:
+            if owns_browser:
+                await self.fetcher.close()
+            if self.negative_cache is not None:
+                self.negative_cache.save()
+            if journal:
+                journal.close()
+            stats['elapsed'] = time.perf_counter() - started
+            if measure_peak_rss:
+                stats['peak_rss_mb'] = _peak_rss_mb()
+            stats['dedup_hits'] = dedup_stats['hits']
+            stats['dedup_misses'] = dedup_stats['misses']
+        
+        return stats
+    
+    def render(self, metadata: LinkMetadata, output_path: str, generate_html: bool = False,
+               downloaded: tuple = None, dedup_stats: dict = None) -> list:
+        """取得済みのメタデータからカード画像（と必要ならHTML）を生成し、出力ファイルのパスを返す
+        
+        ブラウザを使わないため、キャッシュしたメタデータの再描画に使える。
+        
+        Args:
+            downloaded: CardGenerator.download() の結果（プレビューで取得済みの画像を使い回す）
+            dedup_stats: 背景キャッシュのヒット・ミスを数えるdict（CardGenerator.generateを参照）
+        """
+        outputs = self.generator.generate(metadata, output_path, downloaded, dedup_stats)
+        paths = [path for path, _, _ in outputs]
+        
+        if generate_html:
+            # 基準の画像は最初に描画したバリアント（largeを出力しない場合もあるため）
+            image_filename = Path(paths[0]).name
+            html_path = output_path.replace('.png', '.html')
+            image_variants = [(Path(path).name, width, height) for path, width, height in outputs]
+            large_image = any(variant.name == 'large' for variant in self.generator.variants)
+            self.html_generator.generate(metadata, image_filename, html_path, image_variants, large_image)
+            paths.append(html_path)
+        
+        return paths
+    
+    def _batch_output_path(self, url: str, output_dir: str) -> str:
+        """バッチ出力用のファイル名（ドメイン名＋正規化したURLのハッシュ）"""
+        url = normalize_url(url)
+        domain = re.sub(r'[^A-Za-z0-9.-]', '_', urlparse(url).netloc) or 'card'
+        digest = hashlib.sha1(url.encode('utf-8')).hexdigest()[:12]
+        return str(Path(output_dir) / f"{domain}_{digest}.png")
+
+
+@asynccontextmanager
+async def _no_slot(stage: str):
+    """generate_batchでslotsを指定しない場合（制限なし）"""
+    yield
+
+
+def _read_url_list(path: str):
+    """URLリストファイルを1行ずつ読み込む（空行と#で始まる行は無視）"""
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield line
+
+
+def _load_metadata(path: str) -> LinkMetadata:
+    """メタデータJSONを読み込む"""
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    for key in ('title', 'url'):
+        if not data.get(key):
+            raise ValueError(f"メタデータに '{key}' がありません: {path}")
+    return LinkMetadata.from_dict(data)
+
+
+def _save_metadata(metadata: LinkMetadata, path: str):
+    """メタデータをJSONで保存"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(metadata.to_dict(), f, ensure_ascii=False, indent=2)
+    print(f"メタデータを保存しました: {path}")
+
+
+def _print_batch_stats(stats: dict):
+    """バッチ処理の統計を表示"""
+    print("\n📊 バッチ処理結果:")
+    print(f"  件数: {stats['total']}（成功 {stats['succeeded']} / 失敗 {stats['failed']}"
+          f" / 完了済みでスキップ {stats['skipped']}）")
+    if stats['duplicates']:
+        print(f"  同じページのURLでスキップ: {stats['duplicates']} 件")
+    print(f"  処理時間: {stats['elapsed']:.1f}秒")
+    if stats['backoff_skipped']:
+        print(f"  バックオフ中でスキップ（フォールバックで生成）: {len(stats['backoff_skipped'])} 件")
+        for url in stats['backoff_skipped']:
+            print(f"    - {url}")
+    lookups = stats['dedup_hits'] + stats['dedup_misses']
+    if lookups:
+        print(f"  背景の重複排除: {stats['dedup_hits']}/{lookups} 件ヒット"
+              f"（{stats['dedup_hits'] / lookups:.1%}）")
+    if stats['peak_rss_mb'] is not None:
+        print(f"  ピークRSS: {stats['peak_rss_mb']:.1f} MB")
 
 
 async def main():
     if len(sys.argv) < 2:
-        print("使用方法: python linkcard_generator.py <URL> [-o 出力ファイル名] [--generate-html] [--base-url ベースURL]")
+        print("使用方法: python linkcard_generator.py <URL> [-o 出力ファイル名] [--generate-html] [--base-url ベースURL] [--variants large,small,square] [--profile-dir プロファイル置き場]")
+        print("          python linkcard_generator.py --batch URLリスト [--output-dir 出力先] [--concurrency 同時実行数] [--job-id ジョブID] [--no-resolve-redirects] [--retry-failed]")
+        print("          python linkcard_generator.py --sitemap sitemap.xmlのURLまたはパス [--output-dir 出力先] [--sitemap-state 記録ファイル] [--job-id ジョブID] [--journal-dir ジャーナル置き場]")
+        print("          python linkcard_generator.py --from-metadata メタデータJSON [-o 出力ファイル名] [--generate-html]")
         print("例: python linkcard_generator.py https://example.com")
         print("例: python linkcard_generator.py https://example.com -o card.png")
         print("例: python linkcard_generator.py https://example.com --generate-html")
         print("例: python linkcard_generator.py https://example.com --generate-html --base-url https://username.github.io/linkcard")
+        print("例: python linkcard_generator.py https://example.com --variants large,small,square")
+        print("例: python linkcard_generator.py --batch urls.txt --output-dir cards --concurrency 8")
+        print("例: python linkcard_generator.py https://example.com --profile-dir .linkcard_profile  # HTTPキャッシュを次回に再利用")
+        print("例: python linkcard_generator.py --batch urls.txt --job-id regen-2024  # 中断後も同じIDで再開可能")
+        print("例: python linkcard_generator.py --sitemap https://example.com/sitemap.xml  # 前回から更新されたページのみ")
+        print("例: python linkcard_generator.py https://example.com --save-metadata meta.json")
+        print("例: python linkcard_generator.py --from-metadata meta.json -o card.png  # ブラウザを使わず再描画")
         sys.exit(1)
     
-    url = sys.argv[1]
+    url = None
     output_path = "linkcard.png"
     generate_html = False
     base_url = ""
+    variants = None
+    batch_file = None
+    sitemap = None
+    sitemap_state = ".linkcard_cache/sitemap_state.json"
+    profile_dir = None
+    output_dir = "cards"
+    concurrency = 4
+    metadata_file = None
+    job_id = None
+    journal_dir = ".linkcard_jobs"
+    save_metadata = None
+    resolve_redirects = True
+    retry_failed = False
     
     # オプション解析
-    i = 2
+    i = 1
     while i < len(sys.argv):
         if sys.argv[i] == "-o" and i + 1 < len(sys.argv):
             output_path = sys.argv[i + 1]
@@ -457,14 +1348,82 @@ async def main():
         elif sys.argv[i] == "--generate-html":
             generate_html = True
             i += 1
+        elif sys.argv[i] == "--no-resolve-redirects":
+            resolve_redirects = False
+            i += 1
+        elif sys.argv[i] == "--retry-failed":
+            retry_failed = True
+            i += 1
         elif sys.argv[i] == "--base-url" and i + 1 < len(sys.argv):
             base_url = sys.argv[i + 1]
             i += 2
+        elif sys.argv[i] == "--variants" and i + 1 < len(sys.argv):
+            names = [name.strip() for name in sys.argv[i + 1].split(',') if name.strip()]
+            unknown = [name for name in names if name not in CARD_VARIANTS]
+            if unknown:
+                print(f"不明なバリアント: {', '.join(unknown)}（使用可能: {', '.join(CARD_VARIANTS)}）")
+                sys.exit(1)
+            variants = [CARD_VARIANTS[name] for name in names]
+            i += 2
+        elif sys.argv[i] == "--batch" and i + 1 < len(sys.argv):
+            batch_file = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == "--profile-dir" and i + 1 < len(sys.argv):
+            profile_dir = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == "--sitemap" and i + 1 < len(sys.argv):
+            sitemap = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == "--sitemap-state" and i + 1 < len(sys.argv):
+            sitemap_state = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == "--output-dir" and i + 1 < len(sys.argv):
+            output_dir = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == "--concurrency" and i + 1 < len(sys.argv):
+            concurrency = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == "--job-id" and i + 1 < len(sys.argv):
+            job_id = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == "--journal-dir" and i + 1 < len(sys.argv):
+            journal_dir = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == "--from-metadata" and i + 1 < len(sys.argv):
+            metadata_file = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == "--save-metadata" and i + 1 < len(sys.argv):
+            save_metadata = sys.argv[i + 1]
+            i += 2
+        elif url is None and not sys.argv[i].startswith('-'):
+            url = sys.argv[i]
+            i += 1
         else:
             i += 1
     
-    generator = LinkCardGenerator(base_url)
-    await generator.generate(url, output_path, generate_html)
+    generator = LinkCardGenerator(base_url, variants, profile_dir=profile_dir,
+                                  resolve_redirects=resolve_redirects)
+    if metadata_file:
+        # 描画のみ（playwrightは読み込まない）
+        generator.render(_load_metadata(metadata_file), output_path, generate_html)
+    elif batch_file:
+        stats = await generator.generate_batch(
+            _read_url_list(batch_file), output_dir, generate_html, concurrency, job_id, journal_dir,
+            retry_failed=retry_failed
+        )
+        _print_batch_stats(stats)
+    elif sitemap:
+        stats = await generate_from_sitemap(
+            generator, sitemap, output_dir, generate_html, concurrency, sitemap_state, job_id,
+            retry_failed, journal_dir
+        )
+        print(f"\nlastmodが前回から変わっていないためスキップ: {stats['unchanged']} 件")
+        _print_batch_stats(stats)
+    elif url:
+        await generator.generate(url, output_path, generate_html, save_metadata)
+    else:
+        print("URL、--batch または --sitemap を指定してください")
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -4,7 +4,6 @@ from tkinter import ttk, filedialog, messagebox
 from pathlib import Path
 import threading
 from linkcard_generator import LinkCardGenerator
-from PIL import Image, ImageTk
 
 class LinkCardGUI:
     """リンクカード生成ツールのGUIアプリケーション"""
@@ -17,6 +16,7 @@ class LinkCardGUI:
         
         self.generator = LinkCardGenerator()
         self.preview_image = None
+        self.preview_shown = False
         
         self._create_widgets()
         
@@ -133,6 +133,7 @@ class LinkCardGUI:
         self.generate_btn.config(state='disabled')
         self.progress.start(10)
         self.status_var.set("🔍 メタデータを取得中...")
+        self.preview_shown = False
         
         # 別スレッドで実行
         thread = threading.Thread(
@@ -149,45 +150,66 @@ class LinkCardGUI:
             loop = asyncio.new_event_loop()
             asyncio.set_event_loop(loop)
             
-            # 生成実行
-            loop.run_until_complete(
-                self.generator.generate(url, output_path, generate_html)
+            # 生成実行（メタデータ取得直後に低解像度プレビューを表示）
+            paths = loop.run_until_complete(
+                self.generator.generate(
+                    url, output_path, generate_html,
+                    on_preview=lambda img: self.root.after(0, self._show_preview, img)
+                )
             )
             
             loop.close()
             
             # 成功時の処理（メインスレッドで実行）
-            self.root.after(0, self._on_generation_success, output_path)
+            self.root.after(0, self._on_generation_success, paths)
             
         except Exception as e:
             # エラー時の処理（メインスレッドで実行）
             self.root.after(0, self._on_generation_error, str(e))
     
-    def _on_generation_success(self, output_path: str):
-        """生成成功時の処理"""
-        self.progress.stop()
-        self.generate_btn.config(state='normal')
-        self.status_var.set(f"✅ 生成完了！ファイル: {output_path}")
-        
-        # プレビュー表示
+    def _show_preview(self, img):
+        """プレビュー画像を表示（メインスレッドで実行）"""
         try:
-            img = Image.open(output_path)
-            # サイズを調整（600px幅に収める）
-            img.thumbnail((600, 315), Image.Resampling.LANCZOS)
+            from PIL import ImageTk
             photo = ImageTk.PhotoImage(img)
             
             self.preview_label.config(image=photo, text="")
             self.preview_label.image = photo  # 参照を保持
+            self.preview_shown = True
+            self.status_var.set("🎨 プレビューを表示中。高解像度のカードを生成中...")
             
         except Exception as e:
             self.preview_label.config(text=f"プレビュー表示エラー: {e}")
+    
+    def _on_generation_success(self, paths: list):
+        """生成成功時の処理（pathsは出力ファイルのリスト。先頭が基準の画像）"""
+        output_path = paths[0]
+        html_path = next((path for path in paths if path.endswith('.html')), None)
+        self.progress.stop()
+        self.generate_btn.config(state='normal')
+        self.status_var.set(f"✅ 生成完了！ファイル: {output_path}")
+        
+        # プレビュー表示（生成中に表示済みなら読み直さない）
+        if not self.preview_shown:
+            try:
+                from PIL import Image, ImageTk
+                img = Image.open(output_path)
+                # サイズを調整（600px幅に収める）
+                img.thumbnail((600, 315), Image.Resampling.LANCZOS)
+                photo = ImageTk.PhotoImage(img)
+                
+                self.preview_label.config(image=photo, text="")
+                self.preview_label.image = photo  # 参照を保持
+                
+            except Exception as e:
+                self.preview_label.config(text=f"プレビュー表示エラー: {e}")
         
         # 成功メッセージ
         messagebox.showinfo(
             "生成完了",
             f"リンクカードを生成しました！\n\n"
             f"📁 画像: {output_path}\n"
-            f"{'📄 HTML: ' + output_path.replace('.png', '.html') if self.html_var.get() else ''}\n\n"
+            f"{'📄 HTML: ' + html_path if html_path else ''}\n\n"
             f"WebサーバーにアップロードしてXに投稿してください。"
         )
     
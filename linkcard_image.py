@@ -0,0 +1,141 @@
+"""サムネイル画像の候補選び（先頭数KBだけを取得して形式と寸法を調べる）
+
+ページにog:imageやtwitter:imageが複数ある場合、小さなロゴや巨大な原寸画像を
+選んでしまわないよう、各候補の先頭だけをRangeリクエストで取得して寸法を読み、
+1200x630のカードに最も合うものを選ぶ。全体をダウンロードするのは選ばれた1枚だけ。
+"""
+import asyncio
+import io
+import re
+
+# 寸法を読むために取得するバイト数（JPEGはEXIFが大きいと足りないので1回だけ広げる）
+PROBE_BYTES = (16 * 1024, 64 * 1024)
+TARGET_SIZE = (1200, 630)
+
+# 候補の出どころの優先順位（スコアが同じなら先のものを選ぶ）
+SOURCE_RANKS = {'og': 0, 'twitter': 1, 'itemprop': 2, 'image_src': 3}
+
+
+class ImageCandidate:
+    """画像の候補（寸法はog:image:width/heightの値か、調べた結果）"""
+
+    __slots__ = ('url', 'source', 'width', 'height', 'format', 'file_size', 'probed')
+
+    def __init__(self, url: str, source: str, width: int = None, height: int = None):
+        self.url = url
+        self.source = source
+        self.width = width
+        self.height = height
+        self.format = None
+        self.file_size = None
+        self.probed = False
+
+    def __repr__(self) -> str:
+        return f"ImageCandidate(url={self.url!r}, size={self.width}x{self.height}, format={self.format})"
+
+
+def probe_image(url: str, timeout: float = 5) -> dict:
+    """画像の先頭だけを取得して形式・寸法・ファイルサイズを調べる
+
+    Rangeに対応していないサーバーでも、先頭を読んだ時点で接続を閉じる。
+
+    Returns:
+        {'format', 'width', 'height', 'file_size'}。画像として読めなければNone
+    """
+    import requests
+    from PIL import Image
+
+    for probe_bytes in PROBE_BYTES:
+        try:
+            with requests.get(url, timeout=timeout, stream=True, headers={
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+                'Range': f"bytes=0-{probe_bytes - 1}"
+            }) as response:
+                if response.status_code not in (200, 206):
+                    return None
+                file_size = _file_size(response)
+                data = bytearray()
+                for chunk in response.iter_content(chunk_size=8 * 1024):
+                    data += chunk
+                    if len(data) >= probe_bytes:
+                        break
+        except requests.RequestException:
+            return None
+
+        try:
+            with Image.open(io.BytesIO(bytes(data))) as img:
+                width, height = img.size
+                return {'format': img.format, 'width': width, 'height': height, 'file_size': file_size}
+        except Exception:
+            # 全体を読み終えていれば、それ以上取得しても読めない
+            if len(data) < probe_bytes or (file_size is not None and len(data) >= file_size):
+                return None
+    return None
+
+
+def _file_size(response) -> int:
+    """Content-Range（206）またはContent-Length（200）から画像全体のバイト数を求める"""
+    if response.status_code == 206:
+        match = re.search(r'/(\d+)\s*$', response.headers.get('Content-Range', ''))
+        return int(match.group(1)) if match else None
+    length = response.headers.get('Content-Length', '')
+    return int(length) if length.isdigit() else None
+
+
+def score_candidate(candidate: ImageCandidate, target: tuple = TARGET_SIZE,
+                    max_bytes: int = 10 * 1024 * 1024, max_pixels: int = 40_000_000) -> float:
+    """カードへの合い具合（0〜1、使えない画像は-1）
+
+    切り抜きで残る割合（縦横比の近さ）と、拡大せずに済む度合いの積。
+    寸法が分からない候補は、寸法が分かる小さな画像と同程度に低く見積もる。
+    """
+    if candidate.probed and candidate.width is None:
+        return -1.0
+    if candidate.file_size is not None and candidate.file_size > max_bytes:
+        return -1.0
+    if not candidate.width or not candidate.height:
+        return 0.05
+    if candidate.width * candidate.height > max_pixels:
+        return -1.0
+
+    target_width, target_height = target
+    aspect = candidate.width / candidate.height
+    target_aspect = target_width / target_height
+    kept = min(aspect, target_aspect) / max(aspect, target_aspect)
+    resolution = min(1.0, candidate.width / target_width, candidate.height / target_height)
+    return kept * resolution
+
+
+async def choose_image(candidates: list, max_probes: int = 6, target: tuple = TARGET_SIZE,
+                       max_bytes: int = 10 * 1024 * 1024, max_pixels: int = 40_000_000) -> ImageCandidate:
+    """候補を調べて最もカードに合う画像を選ぶ（候補がなければNone）
+
+    候補が1つなら調べずにそのまま返す。調べた候補がどれも使えなければ、
+    調べていない次の候補（なければ先頭の候補）を返す。
+    max_bytes / max_pixelsにはダウンロード側（CardGenerator）の上限を渡し、
+    ダウンロードで拒否される画像を選ばないようにする。
+    """
+    if len(candidates) <= 1:
+        return candidates[0] if candidates else None
+
+    probed = candidates[:max_probes]
+    loop = asyncio.get_running_loop()
+    results = await asyncio.gather(*(
+        loop.run_in_executor(None, probe_image, candidate.url) for candidate in probed
+    ))
+    for candidate, result in zip(probed, results):
+        candidate.probed = True
+        if result is None:
+            candidate.width = candidate.height = None
+            continue
+        candidate.format = result['format']
+        candidate.width = result['width']
+        candidate.height = result['height']
+        candidate.file_size = result['file_size']
+
+    scores = [score_candidate(candidate, target, max_bytes, max_pixels) for candidate in probed]
+    best = max(range(len(probed)), key=lambda index: (scores[index], -index))
+    if scores[best] < 0:
+        # 調べた候補がどれも使えなければ、まだ調べていない候補に賭ける
+        return candidates[len(probed)] if len(candidates) > len(probed) else candidates[0]
+    return probed[best]
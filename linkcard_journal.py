@@ -0,0 +1,136 @@
+"""バッチ処理のチェックポイントジャーナル（中断したジョブの再開用）"""
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+
+class BatchJournal:
+    """URLごとの処理結果を追記するジャーナル（JSON Lines形式）
+
+    同じジョブIDで再実行すると、完了済み（status=done）のURLを読み飛ばし、
+    失敗・未処理のURLだけを再試行できる。fsyncは一定件数・一定時間ごとに
+    まとめて行い、ジャーナル書き込みがボトルネックにならないようにする。
+    """
+
+    def __init__(self, path: str, fsync_every: int = 100, fsync_interval: float = 1.0):
+        """初期化
+
+        Args:
+            path: ジャーナルファイルのパス
+            fsync_every: この件数ごとにfsyncする
+            fsync_interval: 前回のfsyncからこの秒数が経過したらfsyncする
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        # URL → 最新のステータス（メモリ節約のためレコード全体は保持しない）
+        self.statuses = {}
+        # 別名 → URL（リダイレクト前のURLなど。is_doneで別名でも引けるようにする）
+        self.aliases = {}
+        self._load()
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    @classmethod
+    def for_job(cls, job_id: str, journal_dir: str = ".linkcard_jobs", **kwargs) -> "BatchJournal":
+        """ジョブIDに対応するジャーナルを開く"""
+        return cls(Path(journal_dir) / f"{job_id}.jsonl", **kwargs)
+
+    def _load(self):
+        """既存のジャーナルを読み込む（クラッシュで途中まで書かれた最終行は捨てる）"""
+        if not self.path.exists():
+            return
+
+        with open(self.path, 'rb+') as f:
+            data = f.read()
+            end = data.rfind(b'\n') + 1
+            if end < len(data):
+                f.truncate(end)
+
+        for line in data[:end].splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            self.statuses[record['url']] = record['status']
+            for alias in record.get('aliases') or ():
+                self.aliases[alias] = record['url']
+
+    def is_done(self, url: str) -> bool:
+        """完了済みのURLか（別名でもよい）"""
+        return self.statuses.get(self.aliases.get(url, url)) == 'done'
+
+    def record(self, url: str, status: str, metadata: dict = None, outputs: dict = None,
+               error: str = None, aliases: list = None):
+        """1件の処理結果を追記
+
+        Args:
+            url: 対象URL
+            status: done または failed
+            metadata: 取得したメタデータ
+            outputs: 出力ファイルのパス → SHA-256
+            error: エラー内容
+            aliases: 同じ結果として扱う別のURL（件数には数えない）
+        """
+        record = {
+            'url': url,
+            'status': status,
+            'metadata': metadata,
+            'outputs': outputs or {},
+            'error': error,
+            'time': time.time()
+        }
+        if aliases:
+            record['aliases'] = list(aliases)
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.statuses[url] = status
+        for alias in aliases or ():
+            self.aliases[alias] = url
+        self._pending += 1
+
+        if (self._pending >= self.fsync_every
+                or time.monotonic() - self._last_sync >= self.fsync_interval):
+            self.sync()
+
+    def sync(self):
+        """未同期の書き込みをディスクに反映"""
+        if self._pending:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        """同期してファイルを閉じる"""
+        if not self._file.closed:
+            self.sync()
+            self._file.close()
+
+    def counts(self) -> dict:
+        """ステータスごとの件数"""
+        counts = {}
+        for status in self.statuses.values():
+            counts[status] = counts.get(status, 0) + 1
+        return counts
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def hash_files(paths: list) -> dict:
+    """ファイルごとのSHA-256を計算"""
+    digests = {}
+    for path in paths:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        digests[str(path)] = digest.hexdigest()
+    return digests
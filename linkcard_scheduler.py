@@ -0,0 +1,364 @@
+"""優先度付きジョブスケジューラー（対話的なリクエストを一括処理より先に通す）
+
+GUIやCLIからの1件ずつの生成（interactive）と、大量のバッチ処理（batch）を
+同じマシンで動かすときに、LinkCardGeneratorの前段に置いて使う。
+
+    scheduler = JobScheduler(LinkCardGenerator(), pages=4, render_workers=2)
+    await scheduler.start()
+    batch = asyncio.create_task(scheduler.submit_batch(urls, "cards", job_id="nightly"))
+    await scheduler.submit("https://example.com", "card.png", priority='interactive')
+    print(scheduler.metrics())
+"""
+import asyncio
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+# 優先度の高い順
+PRIORITIES = ('interactive', 'batch')
+
+
+class PriorityLimiter:
+    """優先度クラスごとの同時実行枠を持つセマフォ
+
+    枠が空くと、優先度の高いクラスの待ちから順に割り当てる。同じクラス内では
+    ジョブIDごとに順番に（ラウンドロビンで）割り当て、1つの大きなジョブが
+    他のジョブを待たせ続けないようにする。
+    """
+
+    def __init__(self, capacity: int, shares: dict = None, priorities: tuple = PRIORITIES):
+        """初期化
+
+        Args:
+            capacity: 全体の同時実行数
+            shares: クラスごとの同時実行数の上限（省略したクラスはcapacityまで）
+            priorities: 優先度クラス（高い順）
+        """
+        self.capacity = capacity
+        self.priorities = list(priorities)
+        self.shares = {priority: capacity for priority in self.priorities}
+        self.shares.update(shares or {})
+        self.running = {priority: 0 for priority in self.priorities}
+        # クラス → ジョブID → 待ち行列 [(future, 待ち始めた時刻)]
+        self._waiters = {priority: OrderedDict() for priority in self.priorities}
+        self.wait_stats = {
+            priority: {'count': 0, 'total': 0.0, 'max': 0.0, 'samples': deque(maxlen=1000)}
+            for priority in self.priorities
+        }
+
+    @property
+    def in_use(self) -> int:
+        return sum(self.running.values())
+
+    def waiting(self, priority: str) -> int:
+        """待っている数"""
+        return sum(len(queue) for queue in self._waiters[priority].values())
+
+    async def acquire(self, priority: str, job_id: str = None):
+        """枠を確保するまで待つ"""
+        if priority not in self._waiters:
+            raise ValueError(f"不明な優先度: {priority}（使用可能: {', '.join(self.priorities)}）")
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[priority].setdefault(job_id, deque()).append((future, time.perf_counter()))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            # 枠を割り当てられた直後にキャンセルされた場合は返す
+            if future.done() and not future.cancelled():
+                self.release(priority)
+            else:
+                future.cancel()
+            raise
+
+    def release(self, priority: str):
+        """枠を返す"""
+        self.running[priority] -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, priority: str, job_id: str = None):
+        """async with で枠を確保・返却する"""
+        await self.acquire(priority, job_id)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    def _dispatch(self):
+        """空いている枠を優先度順に割り当てる"""
+        while self.in_use < self.capacity:
+            for priority in self.priorities:
+                if self.running[priority] < self.shares[priority] and self._grant_next(priority):
+                    break
+            else:
+                return
+
+    def _grant_next(self, priority: str) -> bool:
+        """クラス内の次のジョブに枠を割り当てる（待ちがなければFalse）"""
+        jobs = self._waiters[priority]
+        while jobs:
+            job_id, queue = next(iter(jobs.items()))
+            future, enqueued = queue.popleft()
+            # ラウンドロビン: 割り当てたジョブは最後に回す
+            if queue:
+                jobs.move_to_end(job_id)
+            else:
+                del jobs[job_id]
+            if future.cancelled():
+                continue
+
+            self.running[priority] += 1
+            waited = time.perf_counter() - enqueued
+            stats = self.wait_stats[priority]
+            stats['count'] += 1
+            stats['total'] += waited
+            stats['max'] = max(stats['max'], waited)
+            stats['samples'].append(waited)
+            future.set_result(None)
+            return True
+        return False
+
+
+def _wait_summary(stats: dict) -> dict:
+    """待ち時間の統計（ミリ秒）"""
+    samples = sorted(stats['samples'])
+    if not samples:
+        return {'count': 0, 'mean_ms': 0.0, 'p95_ms': 0.0, 'max_ms': 0.0}
+    return {
+        'count': stats['count'],
+        'mean_ms': stats['total'] / stats['count'] * 1000,
+        'p95_ms': samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000,
+        'max_ms': stats['max'] * 1000
+    }
+
+
+class JobScheduler:
+    """LinkCardGeneratorの前段に置く優先度付きスケジューラー
+
+    ブラウザのページ（メタデータ取得）と描画ワーカー（画像生成）のそれぞれに
+    PriorityLimiterを置き、interactiveのジョブが次に空いた枠を先に得られるようにする。
+    既定ではbatchは枠を1つ残して使うため、interactiveは待たずに始められる。
+    バッチはLinkCardGenerator.generate_batchで処理する（ジャーナル・重複排除・統計はそのまま）。
+    ピークRSSはジョブごとには測れないため、process_stats()でプロセス全体の値を返す。
+    """
+
+    def __init__(self, generator, pages: int = 4, render_workers: int = 2,
+                 page_shares: dict = None, render_shares: dict = None):
+        """初期化
+
+        Args:
+            generator: LinkCardGenerator
+            pages: 同時に開くブラウザページの数
+            render_workers: 同時に画像を生成する数
+            page_shares: クラスごとのページ数の上限（省略時はbatchがpages-1まで）
+            render_shares: クラスごとの描画数の上限（省略時はbatchがrender_workers-1まで）
+        """
+        self.generator = generator
+        self.pages = PriorityLimiter(
+            pages, page_shares or {'batch': max(1, pages - 1)}
+        )
+        self.renders = PriorityLimiter(
+            render_workers, render_shares or {'batch': max(1, render_workers - 1)}
+        )
+
+    async def start(self):
+        """共有ブラウザを起動"""
+        from linkcard_generator import _reset_peak_rss
+        
+        _reset_peak_rss()
+        await self.generator.fetcher.start()
+
+    async def close(self):
+        """共有ブラウザを終了"""
+        await self.generator.fetcher.close()
+        if self.generator.negative_cache is not None:
+            self.generator.negative_cache.save()
+
+    def slots(self, priority: str, job_id: str = None):
+        """generate_batchのslotsに渡す関数（'page' / 'render' の枠を確保する）"""
+        def slot(stage: str):
+            limiter = self.pages if stage == 'page' else self.renders
+            return limiter.slot(priority, job_id)
+        return slot
+
+    async def submit(self, url: str, output_path: str, generate_html: bool = False,
+                     priority: str = 'interactive', job_id: str = None) -> list:
+        """1件のリンクカードを生成し、出力ファイルのパスを返す
+
+        バックオフ中のURLも取得する（手動での再試行のため。LinkCardGenerator.generateと同じ）。
+        """
+        async with self.pages.slot(priority, job_id):
+            metadata = await self.generator.fetcher.fetch(url)
+
+        loop = asyncio.get_running_loop()
+        async with self.renders.slot(priority, job_id):
+            return await loop.run_in_executor(
+                None, self.generator.render, metadata, output_path, generate_html
+            )
+
+    async def submit_batch(self, urls, output_dir: str, job_id: str, generate_html: bool = False,
+                           priority: str = 'batch', **kwargs) -> dict:
+        """複数URLをジョブとして投入する
+
+        同時に処理するのはページ数ぶんだけなので、大きなURLリストでも待ち行列は伸びず、
+        同じクラスの他のジョブと交互に処理される。kwargsはgenerate_batchに渡す
+        （journal_dir, on_complete, retry_failed）。他のジョブと同時に動くため、
+        統計のpeak_rss_mbはNone（process_stats()を参照）。
+
+        Returns:
+            generate_batchの統計情報
+        """
+        return await self.generator.generate_batch(
+            urls, output_dir, generate_html, self.pages.capacity, job_id,
+            slots=self.slots(priority, job_id), measure_peak_rss=False, **kwargs
+        )
+
+    def process_stats(self) -> dict:
+        """start()以降のプロセス全体のピークRSS（MB）と背景の重複排除の累計"""
+        from linkcard_generator import _peak_rss_mb
+        
+        dedup_stats = self.generator.generator.dedup_stats
+        return {'peak_rss_mb': _peak_rss_mb(), 'dedup_hits': dedup_stats['hits'],
+                'dedup_misses': dedup_stats['misses']}
+
+    def metrics(self) -> dict:
+        """クラスごとの待ち時間・実行中・待機中の数"""
+        metrics = {}
+        for stage, limiter in (('page', self.pages), ('render', self.renders)):
+            for priority in limiter.priorities:
+                summary = _wait_summary(limiter.wait_stats[priority])
+                summary['running'] = limiter.running[priority]
+                summary['waiting'] = limiter.waiting(priority)
+                metrics.setdefault(priority, {})[stage] = summary
+        return metrics
+
+
+def _print_metrics(metrics: dict):
+    """クラスごとの待ち時間を表示"""
+    print("\n⏱️ 待ち時間（クラス別）:")
+    for priority, stages in metrics.items():
+        for stage, summary in stages.items():
+            print(f"  {priority:<12} {stage:<7} {summary['count']:6d} 件  平均 {summary['mean_ms']:8.1f} ms"
+                  f"  p95 {summary['p95_ms']:8.1f} ms  最大 {summary['max_ms']:8.1f} ms")
+
+
+def _print_process_stats(stats: dict):
+    """プロセス全体の統計を表示"""
+    print("\n🖥️ プロセス全体:")
+    lookups = stats['dedup_hits'] + stats['dedup_misses']
+    if lookups:
+        print(f"  背景の重複排除: {stats['dedup_hits']}/{lookups} 件ヒット"
+              f"（{stats['dedup_hits'] / lookups:.1%}）")
+    if stats['peak_rss_mb'] is not None:
+        print(f"  ピークRSS: {stats['peak_rss_mb']:.1f} MB")
+
+
+def _read_stdin_lines(loop, queue: asyncio.Queue):
+    """標準入力を1行ずつキューに渡す（デーモンスレッドで実行。EOFでNone）"""
+    for line in sys.stdin:
+        loop.call_soon_threadsafe(queue.put_nowait, line.strip())
+    loop.call_soon_threadsafe(queue.put_nowait, None)
+
+
+async def main():
+    if len(sys.argv) < 2:
+        print("使用方法: python linkcard_scheduler.py --batch URLリスト [--batch URLリスト ...] [--output-dir 出力先]"
+              " [--pages 4] [--render-workers 2] [--generate-html] [--profile-dir プロファイル置き場]")
+        print("バッチを処理しながら、標準入力から1行に1つ入力したURLを優先して（interactive）生成する。")
+        print("バッチはURLリストごとに別のジョブ（ファイル名がジョブID）として交互に処理する。")
+        print("例: python linkcard_scheduler.py --batch nightly.txt --batch backfill.txt")
+        sys.exit(1)
+
+    from linkcard_generator import LinkCardGenerator, _print_batch_stats, _read_url_list
+
+    batch_files = []
+    output_dir = "cards"
+    pages = 4
+    render_workers = 2
+    generate_html = False
+    profile_dir = None
+
+    # オプション解析
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == "--batch" and i + 1 < len(sys.argv):
+            batch_files.append(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == "--output-dir" and i + 1 < len(sys.argv):
+            output_dir = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == "--pages" and i + 1 < len(sys.argv):
+            pages = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == "--render-workers" and i + 1 < len(sys.argv):
+            render_workers = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == "--profile-dir" and i + 1 < len(sys.argv):
+            profile_dir = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == "--generate-html":
+            generate_html = True
+            i += 1
+        else:
+            i += 1
+
+    generator = LinkCardGenerator(profile_dir=profile_dir)
+    scheduler = JobScheduler(generator, pages, render_workers)
+    await scheduler.start()
+    try:
+        batches = {
+            Path(path).stem: asyncio.create_task(
+                scheduler.submit_batch(_read_url_list(path), output_dir, Path(path).stem, generate_html)
+            )
+            for path in batch_files
+        }
+
+        # 標準入力のURLは割り込みで生成する（バッチがすべて終わるか、EOFで受付を終える）
+        loop = asyncio.get_running_loop()
+        lines = asyncio.Queue()
+        threading.Thread(target=_read_stdin_lines, args=(loop, lines), daemon=True).start()
+        interactive = set()
+
+        async def run_interactive(url):
+            output_path = generator._batch_output_path(url, output_dir)
+            try:
+                paths = await scheduler.submit(url, output_path, generate_html)
+                print(f"✅ 割り込みで生成: {url} → {paths[0]}")
+            except Exception as e:
+                print(f"生成に失敗: {url}: {e}")
+
+        all_batches = asyncio.gather(*batches.values())
+        while True:
+            line = asyncio.ensure_future(lines.get())
+            waits = {line, all_batches} if batches else {line}
+            await asyncio.wait(waits, return_when=asyncio.FIRST_COMPLETED)
+            if not line.done():
+                line.cancel()
+                break
+            url = line.result()
+            if url is None:
+                break
+            if url:
+                task = asyncio.create_task(run_interactive(url))
+                interactive.add(task)
+                task.add_done_callback(interactive.discard)
+
+        await all_batches
+        if interactive:
+            await asyncio.gather(*interactive)
+        for job_id, batch in batches.items():
+            print(f"\n## ジョブ {job_id}")
+            _print_batch_stats(batch.result())
+        _print_metrics(scheduler.metrics())
+        _print_process_stats(scheduler.process_stats())
+    finally:
+        await scheduler.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,214 @@
+"""sitemap.xmlからの一括生成（lastmodが変わっていないページは取得前にスキップ）"""
+import gzip
+import io
+import json
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import urljoin
+from xml.etree.ElementTree import iterparse
+
+from linkcard_url import normalize_url
+
+
+class _ResponseStream(io.RawIOBase):
+    """requestsのレスポンス本体を読み込み可能なストリームとして扱う"""
+
+    def __init__(self, response):
+        self._response = response
+        # Content-Encoding: gzip はiter_contentが展開する
+        self._chunks = response.iter_content(chunk_size=64 * 1024)
+        self._buffer = b''
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._buffer:
+            try:
+                self._buffer = next(self._chunks)
+            except StopIteration:
+                return 0
+        size = min(len(b), len(self._buffer))
+        b[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+    def close(self):
+        self._response.close()
+        super().close()
+
+
+def _open_stream(source: str):
+    """ローカルファイルまたはURLをバイナリストリームとして開く（gzipは自動で展開）"""
+    if source.startswith(('http://', 'https://')):
+        import requests
+        response = requests.get(source, timeout=30, stream=True, headers={
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+        })
+        response.raise_for_status()
+        stream = io.BufferedReader(_ResponseStream(response))
+    else:
+        stream = open(source, 'rb')
+
+    # .xml.gz のように本体がgzipの場合
+    if stream.peek(2)[:2] == b'\x1f\x8b':
+        return gzip.GzipFile(fileobj=stream)
+    return stream
+
+
+def _local_name(tag: str) -> str:
+    """名前空間を除いたタグ名"""
+    return tag.rsplit('}', 1)[-1]
+
+
+def _resolve(base: str, location: str) -> str:
+    """sitemapindex内のsitemapの場所を解決（ローカルファイルは親からの相対パスも可）"""
+    if location.startswith(('http://', 'https://')) or base.startswith(('http://', 'https://')):
+        return urljoin(base, location)
+    return str(Path(base).parent / location)
+
+
+def iter_sitemap(source: str):
+    """sitemapを逐次読み込み、(URL, lastmod) を返す
+
+    sitemapindexは配下のsitemapを順に読み込む。
+    要素は読み終わるたびに破棄するため、大きなsitemapでもメモリは増えない。
+    loc / lastmodは <url> / <sitemap> の直下のものだけを使う（画像拡張の <image:loc> などは無視）。
+    """
+    stream = _open_stream(source)
+    try:
+        root = None
+        # 開いている要素の名前（親を調べるため）
+        path = []
+        loc = None
+        lastmod = None
+        for event, elem in iterparse(stream, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = elem
+                path.append(_local_name(elem.tag))
+                continue
+
+            name = path.pop()
+            parent = path[-1] if path else None
+            if name in ('loc', 'lastmod') and parent not in ('url', 'sitemap'):
+                continue
+            if name == 'loc':
+                loc = (elem.text or '').strip()
+            elif name == 'lastmod':
+                lastmod = (elem.text or '').strip() or None
+            elif name == 'url':
+                if loc:
+                    yield loc, lastmod
+                loc = lastmod = None
+                root.clear()
+            elif name == 'sitemap':
+                if loc:
+                    yield from iter_sitemap(_resolve(source, loc))
+                loc = lastmod = None
+                root.clear()
+    finally:
+        stream.close()
+
+
+def _parse_lastmod(value: str) -> datetime:
+    """W3C Datetime形式のlastmodを解釈（解釈できなければNone）"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+class SitemapState:
+    """前回生成したときのlastmodの記録（正規化したURLごと）"""
+
+    def __init__(self, path: str):
+        """初期化
+
+        Args:
+            path: 保存先のJSONファイル
+        """
+        self.path = Path(path)
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                self.lastmods = json.load(f)
+        except (OSError, ValueError):
+            self.lastmods = {}
+
+    def is_unchanged(self, url: str, lastmod: str) -> bool:
+        """前回の生成以降に更新されていないか（lastmodがなければ常に更新ありとみなす）"""
+        current = _parse_lastmod(lastmod)
+        recorded = _parse_lastmod(self.lastmods.get(normalize_url(url)))
+        return current is not None and recorded is not None and current <= recorded
+
+    def update(self, url: str, lastmod: str):
+        """生成に成功したページのlastmodを記録"""
+        if lastmod:
+            self.lastmods[normalize_url(url)] = lastmod
+
+    def save(self):
+        """ファイルに保存"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.lastmods, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+async def generate_from_sitemap(generator, source: str, output_dir: str = "cards",
+                                generate_html: bool = False, concurrency: int = 4,
+                                state_path: str = ".linkcard_cache/sitemap_state.json",
+                                job_id: str = None, retry_failed: bool = False,
+                                journal_dir: str = ".linkcard_jobs") -> dict:
+    """sitemapに載っているページのリンクカードをまとめて生成
+
+    lastmodが前回の生成時から変わっていないページは、ネットワークにアクセスする前に除外する。
+
+    Args:
+        generator: LinkCardGenerator
+        source: sitemap.xml（またはsitemapindex、.xml.gz）のURLまたはパス
+        output_dir: 出力ディレクトリ
+        generate_html: HTMLファイルも生成するか
+        concurrency: 同時に処理するURL数
+        state_path: lastmodの記録を保存するファイル
+        job_id: generate_batchに渡すジョブID
+        retry_failed: 取得失敗のバックオフ中のURLも取得し直す
+        journal_dir: ジャーナルの保存先（job_idを指定した場合）
+
+    Returns:
+        generate_batchの統計情報に unchanged（スキップした件数）を加えたもの
+    """
+    state = SitemapState(state_path)
+    # 処理中のURLのlastmod（完了時に記録する。同時実行数ぶんしか溜まらない）
+    pending = {}
+    unchanged = 0
+
+    def changed_urls():
+        nonlocal unchanged
+        for url, lastmod in iter_sitemap(source):
+            if state.is_unchanged(url, lastmod):
+                unchanged += 1
+                continue
+            pending[url] = lastmod
+            yield url
+
+    def on_complete(url: str, succeeded: bool):
+        lastmod = pending.pop(url, None)
+        if succeeded:
+            state.update(url, lastmod)
+
+    try:
+        stats = await generator.generate_batch(
+            changed_urls(), output_dir, generate_html, concurrency, job_id, journal_dir,
+            on_complete=on_complete, retry_failed=retry_failed
+        )
+    finally:
+        state.save()
+    stats['unchanged'] = unchanged
+    return stats
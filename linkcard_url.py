@@ -0,0 +1,142 @@
+"""URLの正規化（トラッキングパラメータの除去、リダイレクトの解決、rel="canonical"）
+
+同じページをトラッキングパラメータ付き・末尾スラッシュ付き・http/https・短縮URLなど
+別々のURLで指定しても、キャッシュや出力ファイル名が1つにまとまるよう、
+正規化したURLをキーとして使う。
+"""
+import re
+import threading
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
+
+# 除去するトラッキングパラメータ
+TRACKING_PARAMS = frozenset((
+    'fbclid', 'gclid', 'dclid', 'gbraid', 'wbraid', 'msclkid', 'yclid', 'twclid', 'ttclid',
+    'li_fat_id', 'igshid', 'mc_cid', 'mc_eid', '_ga', '_gl', '_hsenc', '_hsmi', 'mkt_tok',
+    's_cid', 'vero_id', 'oly_anon_id', 'oly_enc_id'
+))
+TRACKING_PREFIXES = ('utm_', 'pk_', 'mtm_', 'hsa_')
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def _is_tracking_param(name: str) -> bool:
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+def normalize_url(url: str) -> str:
+    """キャッシュキー用にURLを正規化
+
+    スキームとホスト名を小文字にしてhttpsに揃え、既定のポート・フラグメント・
+    トラッキングパラメータ・末尾のスラッシュを除き、クエリをキー順に並べる。
+    http/https以外のURLや解釈できないURLはそのまま返す。
+    """
+    url = url.strip()
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return url
+    scheme = parts.scheme.lower()
+    if scheme not in DEFAULT_PORTS or not parts.hostname:
+        return url
+
+    host = parts.hostname.rstrip('.')
+    try:
+        host = host.encode('idna').decode('ascii')
+    except UnicodeError:
+        pass
+    if ':' in host:  # IPv6
+        host = f"[{host}]"
+    if port is not None and port != DEFAULT_PORTS[scheme]:
+        host = f"{host}:{port}"
+    if parts.username:
+        userinfo = parts.username + (f":{parts.password}" if parts.password else "")
+        host = f"{userinfo}@{host}"
+
+    path = re.sub(r'/+$', '', parts.path) or '/'
+    query = sorted(
+        (name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not _is_tracking_param(name)
+    )
+    return urlunsplit(('https', host, path, urlencode(query), ''))
+
+
+def pick_canonical(page_url: str, href: str) -> str:
+    """<link rel="canonical"> のhrefを正規化して返す（信用できなければNone）
+
+    別のホストを指すもの（www.の有無は同一とみなす）と、トップ以外のページが
+    トップページを指すもの（全ページに同じcanonicalを入れているサイトがある）は無視する。
+    """
+    if not href or not href.strip():
+        return None
+    canonical = normalize_url(urljoin(page_url, href.strip()))
+    page = urlsplit(normalize_url(page_url))
+    target = urlsplit(canonical)
+    if not target.hostname or target.scheme != 'https':
+        return None
+
+    def strip_www(host):
+        return host[4:] if host.startswith('www.') else host
+
+    if strip_www(target.netloc) != strip_www(page.netloc):
+        return None
+    if target.path == '/' and not target.query and (page.path != '/' or page.query):
+        return None
+    return canonical
+
+
+class URLCanonicalizer:
+    """リダイレクトをHEADリクエストで解決して、取得するURLとキャッシュキーを決める
+
+    解決結果はメモリ上にLRUでキャッシュする（複数スレッドから呼べる）。
+    """
+
+    def __init__(self, timeout: float = 10, cache_size: int = 10000):
+        """初期化
+
+        Args:
+            timeout: HEADリクエストのタイムアウト（秒）
+            cache_size: 解決結果をキャッシュする件数
+        """
+        self.timeout = timeout
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def resolve(self, url: str) -> tuple:
+        """リダイレクトを解決する
+
+        Returns:
+            (取得するURL, 正規化したキャッシュキー)。解決できなければ元のURLと、
+            それを正規化したキーを返す
+        """
+        with self._lock:
+            if url in self._cache:
+                self._cache.move_to_end(url)
+                return self._cache[url]
+
+        resolved = self._head(url)
+        result = (resolved, normalize_url(resolved))
+
+        with self._lock:
+            self._cache[url] = result
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result
+
+    def _head(self, url: str) -> str:
+        """HEADでリダイレクトをたどった先のURL（失敗したら元のURL）"""
+        if not url.startswith(('http://', 'https://')):
+            return url
+        import requests
+        try:
+            response = requests.head(url, allow_redirects=True, timeout=self.timeout, headers={
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+            })
+            response.close()
+        except requests.RequestException:
+            return url
+        # HEADを受け付けないサーバー（405など）でも、そこまでのリダイレクトは有効
+        return response.url or url
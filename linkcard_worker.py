@@ -0,0 +1,429 @@
+"""複数プロセス・複数ホストでのシャード分割バッチ実行（コーディネーター／ワーカー）
+
+コーディネーターがURLリストをシャードに分割して共有ディレクトリのSQLiteキューに登録し、
+ワーカーがリース付きでシャードを取得して処理する。ワーカーが落ちてもリースが切れれば
+別のワーカーがシャードを引き継ぎ、シャードごとのジャーナルで完了済みのURLは読み飛ばす。
+
+使用方法:
+    python linkcard_worker.py coordinate --urls urls.txt --work-dir work [--workers 4]
+    python linkcard_worker.py work --work-dir work [--worker-id ID]
+
+別ホストのワーカーは共有ディレクトリ上の同じ --work-dir を指定して work を起動する。
+（SQLiteのロックに対応したファイルシステムであること）
+"""
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from linkcard_generator import CARD_VARIANTS, LinkCardGenerator, _read_url_list
+
+
+class ShardQueue:
+    """SQLiteによるリース付きシャードキュー"""
+
+    def __init__(self, db_path: str, max_attempts: int = 3):
+        """初期化
+
+        Args:
+            db_path: キューのデータベースファイル
+            max_attempts: シャードを取得できる最大回数（失敗やリース切れが続くシャードは諦める）
+        """
+        self.max_attempts = max_attempts
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(db_path), timeout=30, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS shards (
+                id INTEGER PRIMARY KEY,
+                urls TEXT NOT NULL,
+                state TEXT NOT NULL DEFAULT 'pending',
+                owner TEXT,
+                lease_expires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS results (
+                shard_id INTEGER PRIMARY KEY,
+                worker TEXT NOT NULL,
+                stats TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS config (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+        """)
+
+    def close(self):
+        self.conn.close()
+
+    def add_shards(self, urls, shard_size: int = 100) -> int:
+        """URLをシャードに分割して登録し、登録したシャード数を返す"""
+        count = 0
+        shard = []
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            for url in urls:
+                shard.append(url)
+                if len(shard) >= shard_size:
+                    self.conn.execute('INSERT INTO shards (urls) VALUES (?)', (json.dumps(shard),))
+                    count += 1
+                    shard = []
+            if shard:
+                self.conn.execute('INSERT INTO shards (urls) VALUES (?)', (json.dumps(shard),))
+                count += 1
+            self.conn.execute('COMMIT')
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+        return count
+
+    def claim(self, worker_id: str, lease_seconds: float) -> tuple:
+        """未処理またはリース切れのシャードを1つ取得（なければNone）
+
+        Returns:
+            (シャードID, URLのリスト)
+        """
+        now = time.time()
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            self._fail_expired(now)
+            row = self.conn.execute(
+                "SELECT id, urls FROM shards"
+                " WHERE (state = 'pending' OR (state = 'leased' AND lease_expires < ?))"
+                " AND attempts < ? ORDER BY id LIMIT 1",
+                (now, self.max_attempts)
+            ).fetchone()
+            if row is None:
+                self.conn.execute('COMMIT')
+                return None
+            self.conn.execute(
+                "UPDATE shards SET state = 'leased', owner = ?, lease_expires = ?,"
+                " attempts = attempts + 1 WHERE id = ?",
+                (worker_id, now + lease_seconds, row[0])
+            )
+            self.conn.execute('COMMIT')
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+        return row[0], json.loads(row[1])
+
+    def _fail_expired(self, now: float):
+        """最後の試行でリースが切れたシャード（ワーカーが落ちたもの）をfailedにする"""
+        self.conn.execute(
+            "UPDATE shards SET state = 'failed', owner = NULL, lease_expires = NULL"
+            " WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?",
+            (now, self.max_attempts)
+        )
+
+    def expire_leases(self):
+        """リース切れで再取得できないシャードをfailedにする"""
+        self._fail_expired(time.time())
+
+    def renew(self, shard_id: int, worker_id: str, lease_seconds: float) -> bool:
+        """リースを延長（他のワーカーに奪われていたらFalse）"""
+        cursor = self.conn.execute(
+            "UPDATE shards SET lease_expires = ?"
+            " WHERE id = ? AND owner = ? AND state = 'leased'",
+            (time.time() + lease_seconds, shard_id, worker_id)
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, shard_id: int, worker_id: str, stats: dict):
+        """シャードを完了にして統計を保存"""
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            self.conn.execute(
+                "UPDATE shards SET state = 'done', lease_expires = NULL WHERE id = ? AND owner = ?",
+                (shard_id, worker_id)
+            )
+            self.conn.execute(
+                'INSERT OR REPLACE INTO results (shard_id, worker, stats) VALUES (?, ?, ?)',
+                (shard_id, worker_id, json.dumps(stats))
+            )
+            self.conn.execute('COMMIT')
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+
+    def release(self, shard_id: int, worker_id: str):
+        """処理できなかったシャードを未処理に戻す（max_attempts回失敗したらfailedにする）"""
+        self.conn.execute(
+            "UPDATE shards SET owner = NULL, lease_expires = NULL,"
+            " state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END"
+            " WHERE id = ? AND owner = ? AND state = 'leased'",
+            (self.max_attempts, shard_id, worker_id)
+        )
+
+    def release_owner(self, worker_id: str) -> int:
+        """落ちたワーカーが持っていたシャードを未処理に戻し、戻したシャード数を返す
+
+        release() と同じく、max_attempts回取得されたシャードはfailedにする。
+        """
+        cursor = self.conn.execute(
+            "UPDATE shards SET owner = NULL, lease_expires = NULL,"
+            " state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END"
+            " WHERE owner = ? AND state = 'leased'",
+            (self.max_attempts, worker_id)
+        )
+        return cursor.rowcount
+
+    def retry_failed(self) -> int:
+        """failedのシャードを取得回数をリセットして未処理に戻し、戻したシャード数を返す"""
+        cursor = self.conn.execute(
+            "UPDATE shards SET state = 'pending', owner = NULL, lease_expires = NULL, attempts = 0"
+            " WHERE state = 'failed'"
+        )
+        return cursor.rowcount
+
+    def counts(self) -> dict:
+        """状態ごとのシャード数"""
+        return dict(self.conn.execute('SELECT state, COUNT(*) FROM shards GROUP BY state'))
+
+    def results(self) -> list:
+        """完了したシャードの統計のリスト"""
+        return [json.loads(row[0]) for row in self.conn.execute('SELECT stats FROM results ORDER BY shard_id')]
+
+    def set_config(self, config: dict):
+        """ジョブ設定を保存（別ホストのワーカーも同じ設定で動かすため）"""
+        self.conn.executemany(
+            'INSERT OR REPLACE INTO config (key, value) VALUES (?, ?)',
+            [(key, json.dumps(value)) for key, value in config.items()]
+        )
+
+    def get_config(self) -> dict:
+        """ジョブ設定を取得"""
+        return {key: json.loads(value) for key, value in self.conn.execute('SELECT key, value FROM config')}
+
+
+def merge_stats(results: list) -> dict:
+    """ワーカーごとの統計をまとめる（時間とメモリは最大値、リストは連結、数値は合計）"""
+    merged = {}
+    for stats in results:
+        for key, value in stats.items():
+            if value is None:
+                merged.setdefault(key, None)
+            elif key in ('elapsed', 'peak_rss_mb'):
+                merged[key] = max(merged.get(key) or 0, value)
+            elif isinstance(value, list):
+                merged.setdefault(key, []).extend(value)
+            elif isinstance(value, (int, float)):
+                merged[key] = (merged.get(key) or 0) + value
+    return merged
+
+
+def _queue_path(work_dir: str) -> Path:
+    return Path(work_dir) / 'queue.db'
+
+
+async def run_worker(work_dir: str, worker_id: str = None, lease_seconds: float = 300) -> int:
+    """ワーカー: キューが空になるまでシャードを取得して処理し、処理したシャード数を返す"""
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    queue = ShardQueue(_queue_path(work_dir))
+    config = queue.get_config()
+    variants = [CARD_VARIANTS[name] for name in config.get('variants') or ['large']]
+    generator = LinkCardGenerator(config.get('base_url', ''), variants, str(Path(work_dir) / 'cache'),
+                                  config.get('profile_dir'), config.get('resolve_redirects', True))
+    journal_dir = str(Path(work_dir) / 'journals')
+    processed = 0
+
+    # ブラウザはシャードをまたいで使い回す
+    await generator.fetcher.start()
+    try:
+        while True:
+            claim = queue.claim(worker_id, lease_seconds)
+            if claim is None:
+                break
+            shard_id, urls = claim
+            print(f"[{worker_id}] シャード {shard_id} を処理中（{len(urls)}件）")
+
+            batch = asyncio.create_task(generator.generate_batch(
+                urls, config.get('output_dir', 'cards'), config.get('generate_html', False),
+                config.get('concurrency', 4), job_id=f"shard-{shard_id}", journal_dir=journal_dir
+            ))
+
+            # 処理中はリースを延長し続ける。奪われたら処理を中断する
+            while not batch.done():
+                await asyncio.wait({batch}, timeout=lease_seconds / 3)
+                if not batch.done() and not queue.renew(shard_id, worker_id, lease_seconds):
+                    print(f"[{worker_id}] シャード {shard_id} のリースを失いました")
+                    batch.cancel()
+
+            try:
+                stats = batch.result()
+            except asyncio.CancelledError:
+                continue
+            except Exception as e:
+                print(f"[{worker_id}] シャード {shard_id} の処理に失敗: {e}")
+                queue.release(shard_id, worker_id)
+                continue
+
+            stats['worker'] = worker_id
+            queue.complete(shard_id, worker_id, stats)
+            processed += 1
+    finally:
+        await generator.fetcher.close()
+        queue.close()
+
+    return processed
+
+
+def run_coordinator(url_file: str, work_dir: str, workers: int = 4, shard_size: int = 100,
+                    config: dict = None) -> dict:
+    """コーディネーター: シャードを登録し、ワーカーをサブプロセスで起動して統計をまとめる
+
+    work_dirに既存のキューがあればURLは登録し直さず、残りのシャードから再開する
+    （前回failedになったシャードも取得回数をリセットして処理し直す）。
+    異常終了したワーカーは統計の failed_workers に (ワーカーID, 終了コード) で記録し、
+    持っていたシャードをすぐに未処理に戻す。シャードを処理中に落ちたワーカーは、
+    未処理のシャードが残っていれば起動し直す（起動直後に落ちるワーカーは起動し直さない）。
+    """
+    queue = ShardQueue(_queue_path(work_dir))
+    try:
+        if not queue.counts():
+            shards = queue.add_shards(_read_url_list(url_file), shard_size)
+            print(f"{shards} シャードを登録しました")
+        else:
+            retried = queue.retry_failed()
+            if retried:
+                print(f"失敗したシャード {retried} 件を処理し直します")
+            print(f"既存のキューから再開します: {queue.counts()}")
+        queue.set_config(config or {})
+
+        def start_worker(worker_id):
+            return subprocess.Popen([
+                sys.executable, str(Path(__file__).resolve()), 'work',
+                '--work-dir', work_dir, '--worker-id', worker_id
+            ])
+
+        started = time.perf_counter()
+        processes = {}
+        for i in range(workers):
+            worker_id = f"{socket.gethostname()}-w{i}"
+            processes[worker_id] = start_worker(worker_id)
+        failed_workers = []
+        while processes:
+            for worker_id, process in list(processes.items()):
+                if process.poll() is None:
+                    continue
+                del processes[worker_id]
+                if process.returncode == 0:
+                    continue
+                failed_workers.append((worker_id, process.returncode))
+                # リース切れを待たずに、落ちたワーカーのシャードを他のワーカーに回す。
+                # シャードを持っていたワーカーだけ起動し直す（取得回数が増えるので無限には続かない）
+                released = queue.release_owner(worker_id)
+                if released and queue.counts().get('pending'):
+                    print(f"ワーカー {worker_id} を起動し直します（シャード {released} 件を未処理に戻しました）")
+                    processes[worker_id] = start_worker(worker_id)
+            if processes:
+                time.sleep(0.5)
+
+        queue.expire_leases()
+        stats = merge_stats(queue.results())
+        stats['elapsed'] = time.perf_counter() - started
+        stats['shards'] = queue.counts()
+        stats['failed_workers'] = failed_workers
+        return stats
+    finally:
+        queue.close()
+
+
+def _print_merged_stats(stats: dict):
+    """まとめた統計を表示"""
+    print("\n📊 全ワーカーの集計:")
+    print(f"  シャード: {stats.get('shards')}")
+    for worker_id, returncode in stats.get('failed_workers') or []:
+        print(f"  ⚠️ ワーカー {worker_id} が異常終了しました（終了コード {returncode}）")
+    print(f"  件数: {stats.get('total', 0)}（成功 {stats.get('succeeded', 0)} / 失敗 {stats.get('failed', 0)}"
+          f" / 完了済みでスキップ {stats.get('skipped', 0)}）")
+    if stats.get('duplicates'):
+        print(f"  同じページのURLでスキップ: {stats['duplicates']} 件")
+    print(f"  処理時間: {stats.get('elapsed', 0):.1f}秒")
+    skipped = stats.get('backoff_skipped') or []
+    if skipped:
+        print(f"  バックオフ中でスキップ（フォールバックで生成）: {len(skipped)} 件")
+        for url in skipped:
+            print(f"    - {url}")
+    lookups = stats.get('dedup_hits', 0) + stats.get('dedup_misses', 0)
+    if lookups:
+        print(f"  背景の重複排除: {stats['dedup_hits']}/{lookups} 件ヒット"
+              f"（{stats['dedup_hits'] / lookups:.1%}）")
+    if stats.get('peak_rss_mb') is not None:
+        print(f"  ワーカーの最大ピークRSS: {stats['peak_rss_mb']:.1f} MB")
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ('coordinate', 'work'):
+        print("使用方法: python linkcard_worker.py coordinate --urls URLリスト --work-dir 作業ディレクトリ"
+              " [--workers 4] [--shard-size 100] [--output-dir cards] [--concurrency 4]"
+              " [--generate-html] [--base-url ベースURL] [--variants large,small] [--profile-dir プロファイル置き場]"
+              " [--no-resolve-redirects]")
+        print("          python linkcard_worker.py work --work-dir 作業ディレクトリ [--worker-id ID]")
+        sys.exit(1)
+
+    command = sys.argv[1]
+    options = {}
+    flags = set()
+
+    # オプション解析
+    i = 2
+    while i < len(sys.argv):
+        if sys.argv[i] == "--generate-html":
+            flags.add('generate_html')
+            i += 1
+        elif sys.argv[i] == "--no-resolve-redirects":
+            flags.add('no_resolve_redirects')
+            i += 1
+        elif sys.argv[i].startswith('--') and i + 1 < len(sys.argv):
+            options[sys.argv[i][2:].replace('-', '_')] = sys.argv[i + 1]
+            i += 2
+        else:
+            i += 1
+
+    if 'work_dir' not in options:
+        print("--work-dir を指定してください")
+        sys.exit(1)
+
+    if command == 'work':
+        processed = asyncio.run(run_worker(options['work_dir'], options.get('worker_id'),
+                                           float(options.get('lease', 300))))
+        print(f"ワーカー終了: {processed} シャードを処理しました")
+        return
+
+    if 'urls' not in options:
+        print("--urls を指定してください")
+        sys.exit(1)
+
+    variants = [name.strip() for name in options.get('variants', 'large').split(',') if name.strip()]
+    unknown = [name for name in variants if name not in CARD_VARIANTS]
+    if unknown:
+        print(f"不明なバリアント: {', '.join(unknown)}（使用可能: {', '.join(CARD_VARIANTS)}）")
+        sys.exit(1)
+
+    config = {
+        'output_dir': options.get('output_dir', 'cards'),
+        'generate_html': 'generate_html' in flags,
+        'base_url': options.get('base_url', ''),
+        'variants': variants,
+        'concurrency': int(options.get('concurrency', 4)),
+        'profile_dir': options.get('profile_dir'),
+        'resolve_redirects': 'no_resolve_redirects' not in flags,
+    }
+    stats = run_coordinator(options['urls'], options['work_dir'], int(options.get('workers', 4)),
+                            int(options.get('shard_size', 100)), config)
+    _print_merged_stats(stats)
+    # 未処理・処理中・失敗したシャードが残っていれば失敗として終了する
+    remaining = sum(stats['shards'].get(state, 0) for state in ('pending', 'leased', 'failed'))
+    if remaining:
+        print(f"未完了のシャードが {remaining} 件残っています"
+              "（同じ --work-dir で再実行すると、失敗したシャードも含めて再開します）")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""linkcard_sitemap のテスト（tests/fixtures/sitemap のローカルファイルを使う）"""
+import asyncio
+import gzip
+import shutil
+from pathlib import Path
+
+from linkcard_sitemap import SitemapState, generate_from_sitemap, iter_sitemap
+
+FIXTURES = Path(__file__).resolve().parent / 'fixtures' / 'sitemap'
+
+PLAIN = [
+    ('https://example.com/a', '2024-01-01'),
+    ('https://example.com/b', '2024-02-01T10:00:00+09:00'),
+    ('https://example.com/c', None),
+]
+
+
+class StubGenerator:
+    """generate_batchだけを持つLinkCardGeneratorの代わり（failingのURLは失敗扱い）"""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.generated = []
+        self.journal_dir = None
+
+    async def generate_batch(self, urls, output_dir, generate_html, concurrency, job_id,
+                             journal_dir=".linkcard_jobs", on_complete=None, retry_failed=False):
+        self.journal_dir = journal_dir
+        stats = {'total': 0, 'succeeded': 0, 'failed': 0}
+        for url in urls:
+            stats['total'] += 1
+            self.generated.append(url)
+            succeeded = url not in self.failing
+            stats['succeeded' if succeeded else 'failed'] += 1
+            on_complete(url, succeeded)
+        return stats
+
+
+def _run(generator, source, state_path):
+    return asyncio.run(generate_from_sitemap(generator, str(source), state_path=str(state_path)))
+
+
+def test_plain_sitemap():
+    assert list(iter_sitemap(str(FIXTURES / 'sitemap.xml'))) == PLAIN
+
+
+def test_sitemap_index_with_relative_children():
+    assert list(iter_sitemap(str(FIXTURES / 'sitemap_index.xml'))) == PLAIN + [
+        ('https://example.com/gallery', '2024-01-01'),
+    ]
+
+
+def test_gzipped_sitemap(tmp_path):
+    source = tmp_path / 'sitemap.xml.gz'
+    with open(FIXTURES / 'sitemap.xml', 'rb') as f, gzip.open(source, 'wb') as out:
+        shutil.copyfileobj(f, out)
+    assert list(iter_sitemap(str(source))) == PLAIN
+
+
+def test_image_extension_does_not_replace_page_loc():
+    entries = list(iter_sitemap(str(FIXTURES / 'sub' / 'sitemap_images.xml')))
+    assert entries == [('https://example.com/gallery', '2024-01-01')]
+
+
+def test_lastmod_skip_and_update(tmp_path):
+    state_path = tmp_path / 'state.json'
+    source = FIXTURES / 'sitemap.xml'
+
+    # 初回はすべて生成し、失敗したbは記録しない
+    generator = StubGenerator(failing={'https://example.com/b'})
+    stats = _run(generator, source, state_path)
+    assert generator.generated == [url for url, _ in PLAIN]
+    assert stats['unchanged'] == 0
+    assert SitemapState(state_path).lastmods == {'https://example.com/a': '2024-01-01'}
+
+    # 2回目: aは更新なしでスキップ、bは前回失敗したので再試行、lastmodのないcは毎回生成
+    generator = StubGenerator()
+    stats = _run(generator, source, state_path)
+    assert generator.generated == ['https://example.com/b', 'https://example.com/c']
+    assert stats['unchanged'] == 1
+    assert set(SitemapState(state_path).lastmods) == {'https://example.com/a', 'https://example.com/b'}
+
+    # lastmodが新しくなったページは生成し直す
+    updated = tmp_path / 'sitemap.xml'
+    updated.write_text(
+        source.read_text(encoding='utf-8').replace('2024-01-01', '2024-05-01'), encoding='utf-8'
+    )
+    generator = StubGenerator()
+    stats = _run(generator, updated, state_path)
+    assert generator.generated == ['https://example.com/a', 'https://example.com/c']
+    assert stats['unchanged'] == 1
+    assert SitemapState(state_path).lastmods['https://example.com/a'] == '2024-05-01'
+
+
+def test_journal_dir_is_forwarded(tmp_path):
+    generator = StubGenerator()
+    asyncio.run(generate_from_sitemap(
+        generator, str(FIXTURES / 'sitemap.xml'), state_path=str(tmp_path / 'state.json'),
+        job_id='sitemap', journal_dir=str(tmp_path / 'journals')
+    ))
+    assert generator.journal_dir == str(tmp_path / 'journals')